@@ -1,8 +1,17 @@
 import csv
 import subprocess
 import json
-import ast
+import re
+import sys
+import time
+import atexit
+import sqlite3
 import logging
+import argparse
+from itertools import islice
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from nested_columns import parse_nested
 
 # Configure logging
 logging.basicConfig(
@@ -14,6 +23,226 @@ logging.basicConfig(
 # File names
 input_file = 'products.csv'
 output_file = 'products_with_absolute_urls.csv'
+# URLs written to the Node worker before reading its replies
+NODE_BATCH_SIZE = 100
+
+# wix:image://v1/<media id>/<file name>#originWidth=..&originHeight=..
+WIX_IMAGE_URL = re.compile(r'^wix:image://v1/([^/#]+)(?:/[^#]*)?(?:#.*)?$')
+WIX_MEDIA_PREFIX = 'https://static.wixstatic.com/media/'
+
+# Node conversions persisted across runs, with least recently used
+# entries evicted once the cache holds more than CACHE_MAX_ENTRIES
+CACHE_FILE = 'url_conversion_cache.sqlite3'
+CACHE_MAX_ENTRIES = 500000
+
+# Rows handed to a worker at a time by `--workers` runs
+CHUNK_SIZE = 500
+
+# How each URL was converted during this run
+conversion_stats = Counter()
+
+
+class NodeConverter:
+    """
+    A long-lived `node convertUrl.js --lines` process. URLs go in one
+    per line and come back as one JSON reply per line, so the Node start
+    up and SDK load are paid once instead of once per image.
+    """
+
+    def __init__(self, script="convertUrl.js"):
+        self.script = script
+        self.process = None
+
+    def start(self):
+        self.process = subprocess.Popen(
+            ['node', self.script, '--lines'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            encoding='utf-8',
+            bufsize=1
+        )
+        logging.info(f'Started URL conversion worker '
+                     f'(pid {self.process.pid})')
+
+    def close(self):
+        if self.process and self.process.poll() is None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+
+    def convert_many(self, urls):
+        """
+        Return one reply dict per URL, in order: {'url': ...} on success
+        or {'error': ...}. Each reply echoes its input URL as 'src'; on
+        any reply that can't be read or doesn't match, the worker is
+        stopped, so the next call starts a fresh one instead of reading
+        this call's leftover replies, and OSError or ValueError is raised.
+        """
+        if self.process is None or self.process.poll() is not None:
+            self.start()
+        replies = []
+        try:
+            for start in range(0, len(urls), NODE_BATCH_SIZE):
+                batch = [url.strip() for url in
+                         urls[start:start + NODE_BATCH_SIZE]]
+                self.process.stdin.write(
+                    ''.join(f'{url}\n' for url in batch))
+                self.process.stdin.flush()
+                for url in batch:
+                    line = self.process.stdout.readline()
+                    if not line:
+                        raise OSError('URL conversion worker exited')
+                    reply = json.loads(line)
+                    if not isinstance(reply, dict) or \
+                            reply.get('src') != url:
+                        raise ValueError(f'URL conversion worker replied '
+                                         f'{line.strip()!r} for {url!r}')
+                    replies.append(reply)
+        except (OSError, ValueError):
+            self.close()
+            raise
+        return replies
+
+
+class ConversionCache:
+    """
+    Internal URL -> absolute URL map kept in SQLite. Media IDs never
+    change, so a URL converted once never needs the Node worker again.
+    """
+
+    def __init__(self, path=CACHE_FILE, max_entries=CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.connection = None
+        self.size = 0
+
+    def open(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path, timeout=60)
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS conversions ('
+                'url TEXT PRIMARY KEY, absolute_url TEXT NOT NULL, '
+                'last_used REAL NOT NULL)')
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS conversions_last_used '
+                'ON conversions (last_used)')
+            self.size = self.connection.execute(
+                'SELECT COUNT(*) FROM conversions').fetchone()[0]
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def get_many(self, urls):
+        """Return {url: absolute_url} for the cached URLs among `urls`."""
+        connection = self.open()
+        placeholders = ','.join('?' * len(urls))
+        found = dict(connection.execute(
+            f'SELECT url, absolute_url FROM conversions '
+            f'WHERE url IN ({placeholders})', urls).fetchall())
+        if found:
+            with connection:
+                connection.executemany(
+                    'UPDATE conversions SET last_used = ? WHERE url = ?',
+                    [(time.time(), url) for url in found])
+        return found
+
+    def put_many(self, conversions):
+        connection = self.open()
+        with connection:
+            before = connection.total_changes
+            connection.executemany(
+                'INSERT OR IGNORE INTO conversions VALUES (?, ?, ?)',
+                [(url, absolute_url, time.time())
+                 for url, absolute_url in conversions.items()])
+            self.size += connection.total_changes - before
+        if self.size > self.max_entries:
+            self.evict()
+
+    def evict(self):
+        # Trim to 90% of the cap so eviction doesn't run on every insert
+        excess = self.size - int(self.max_entries * 0.9)
+        with self.connection:
+            self.connection.execute(
+                'DELETE FROM conversions WHERE url IN (SELECT url FROM '
+                'conversions ORDER BY last_used LIMIT ?)', (excess,))
+        self.size = self.connection.execute(
+            'SELECT COUNT(*) FROM conversions').fetchone()[0]
+        conversion_stats['cache_evictions'] += excess
+        logging.info(f'Evicted {excess} cached conversions')
+
+
+node_converter = NodeConverter()
+atexit.register(node_converter.close)
+conversion_cache = ConversionCache()
+atexit.register(conversion_cache.close)
+
+
+# Convert many URLs with the Node worker
+def convert_media_urls(wix_internal_urls):
+    """
+    Calls the JavaScript SDK to convert Wix internal URLs to absolute
+    URLs, answering from the conversion cache first. A URL that fails to
+    convert is logged and returned unchanged.
+    """
+    wanted = list(dict.fromkeys(url for url in wix_internal_urls if url))
+    if not wanted:
+        return list(wix_internal_urls)
+    try:
+        converted = conversion_cache.get_many(wanted)
+    except sqlite3.Error as e:
+        logging.error(f'Conversion cache unavailable: {e}')
+        converted = {}
+    conversion_stats['cache_hits'] += len(converted)
+    to_convert = [url for url in wanted if url not in converted]
+    conversion_stats['cache_misses'] += len(to_convert)
+
+    if to_convert:
+        try:
+            replies = node_converter.convert_many(to_convert)
+        except (OSError, ValueError) as e:
+            logging.error(f'Unexpected error in URL conversion: {str(e)}')
+            replies = [{'error': str(e)}] * len(to_convert)
+
+        fresh = {}
+        for url, reply in zip(to_convert, replies):
+            if reply.get('error'):
+                logging.error(f'Error in URL conversion for {url}: '
+                              f'{reply["error"]}')
+            elif not reply.get('url'):
+                logging.warning(f'Empty response from convertUrl.js '
+                                f'for: {url}')
+            else:
+                fresh[url] = reply['url']
+        converted.update(fresh)
+        if fresh:
+            try:
+                conversion_cache.put_many(fresh)
+            except sqlite3.Error as e:
+                logging.error(f'Could not update conversion cache: {e}')
+
+    return [converted.get(url, url) if url else ''
+            for url in wix_internal_urls]
+
+
+# Convert a wix:image URL without the SDK
+def wix_image_to_url(wix_internal_url):
+    """
+    Rewrite wix:image://v1/<id>/... to the static.wixstatic.com URL that
+    media.getImageUrl returns for it. Returns None for any other shape,
+    which is left to the Node converter.
+    """
+    match = WIX_IMAGE_URL.match(wix_internal_url.strip())
+    if not match:
+        return None
+    return WIX_MEDIA_PREFIX + match.group(1)
 
 
 # Call the JavaScript script for URL conversion
@@ -23,28 +252,7 @@ def convert_media_url(wix_internal_url):
     """
     if not wix_internal_url:
         return ''
-
-    try:
-        # Call Node.js script
-        result = subprocess.run(
-            ['node', "convertUrl.js"],
-            input=wix_internal_url.encode('utf-8'),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True
-        )
-        output = result.stdout.decode('utf-8').strip()
-        if not output:
-            logging.warning(f'Empty response from convertUrl.js'
-                            'for: {wix_internal_url}')
-            return wix_internal_url
-        return output
-    except subprocess.CalledProcessError as e:
-        logging.error(f'Error in URL conversion: {e.stderr.decode("utf-8")}')
-        return wix_internal_url
-    except Exception as e:
-        logging.error(f'Unexpected error in URL conversion: {str(e)}')
-        return wix_internal_url
+    return convert_media_urls([wix_internal_url])[0]
 
 
 # Process the media items field
@@ -57,25 +265,59 @@ def process_media_items(media_items):
         return ""
 
     try:
-        # Use ast.literal_eval to convert the string into Python list
-        items = ast.literal_eval(media_items)
+        # Convert the JSON or Python literal string into a Python list
+        items = parse_nested(media_items)
         if not isinstance(items, list):
             logging.error(f'Unexpected media items format: {media_items}')
             return ""
-        # Extract and convert the src of each media item
-        absolute_urls = [convert_media_url(item.get('src', ''))
-                         for item in items]
+        # Extract and convert the src of each media item, natively when
+        # the shape is known and through Node otherwise
+        srcs = [item.get('src', '') for item in items]
+        absolute_urls = [wix_image_to_url(src) if src else ''
+                         for src in srcs]
+        fallback = [i for i, url in enumerate(absolute_urls) if url is None]
+        conversion_stats['native'] += len(srcs) - len(fallback)
+        if fallback:
+            conversion_stats['node'] += len(fallback)
+            converted = convert_media_urls([srcs[i] for i in fallback])
+            for i, url in zip(fallback, converted):
+                absolute_urls[i] = url
         return ','.join(absolute_urls)
     except (ValueError, SyntaxError) as e:
         logging.error(f'Error decoding media items JSON: {e}')
         return ""
 
 
+# Convert the media items of a chunk of rows
+def process_chunk(rows):
+    """
+    Runs in a worker process, which keeps its own Node worker and cache
+    connection. Returns the rows and the conversion counts for them.
+    """
+    before = conversion_stats.copy()
+    for row in rows:
+        row['media items'] = process_media_items(row.get('media items', ''))
+    return rows, conversion_stats - before
+
+
+# Write a converted chunk once its worker is done
+def write_chunk(writer, future, chunk_number, row_count):
+    rows, stats = future.result()
+    writer.writerows(rows)
+    conversion_stats.update(stats)
+    logging.info(f'Chunk {chunk_number} done: {len(rows)} rows, '
+                 f'{row_count + len(rows)} processed...')
+    return len(rows)
+
+
 # Process CSV
-def process_csv(input_file, output_file):
+def process_csv(input_file, output_file, workers=1, chunk_size=CHUNK_SIZE):
     """
     Process the input csv file, write output csv file with the same headers
-    but change the media items to absolute urls
+    but change the media items to absolute urls.
+    With more than one worker, chunks of `chunk_size` rows are converted
+    in a process pool and written back in their original order; at most
+    two chunks per worker are held in memory.
     """
     with open(input_file, mode='r', encoding='utf-8') as infile, \
          open(output_file, mode='w', newline='', encoding='utf-8') as outfile:
@@ -88,17 +330,94 @@ def process_csv(input_file, output_file):
         writer.writeheader()
 
         row_count = 0
-        for row in reader:
-            # Process and update the media items columns
-            row['media items'] = process_media_items(row.get(
+        if workers > 1:
+            chunks = iter(lambda: list(islice(reader, chunk_size)), [])
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                pending = deque()
+                chunk_number = 0
+                for chunk in chunks:
+                    pending.append(executor.submit(process_chunk, chunk))
+                    if len(pending) < workers * 2:
+                        continue
+                    row_count += write_chunk(writer, pending.popleft(),
+                                             chunk_number, row_count)
+                    chunk_number += 1
+                while pending:
+                    row_count += write_chunk(writer, pending.popleft(),
+                                             chunk_number, row_count)
+                    chunk_number += 1
+        else:
+            for row in reader:
+                # Process and update the media items columns
+                row['media items'] = process_media_items(row.get(
                                                             'media items',
                                                             ''))
-            writer.writerow(row)
-            row_count += 1
-            if row_count % 100 == 0:
-                logging.info(f'Processed {row_count} rows...')
+                writer.writerow(row)
+                row_count += 1
+                if row_count % 100 == 0:
+                    logging.info(f'Processed {row_count} rows...')
     logging.info(f'Processed {row_count} rows. Data saved to {output_file}')
+    logging.info(f'URL conversions: {conversion_stats["native"]} native, '
+                 f'{conversion_stats["node"]} through Node')
+    logging.info(f'Conversion cache: {conversion_stats["cache_hits"]} hits, '
+                 f'{conversion_stats["cache_misses"]} misses, '
+                 f'{conversion_stats["cache_evictions"]} evicted')
+
+
+# Compare the Python and Node converters
+def check_parity(corpus):
+    """
+    Convert every wix:image URL in `corpus` both ways and log each
+    difference. Returns the number of mismatches.
+    """
+    urls = [url for url in dict.fromkeys(corpus)
+            if url and wix_image_to_url(url) is not None]
+    node_urls = node_converter.convert_many(urls)
+    mismatches = 0
+    for url, reply in zip(urls, node_urls):
+        native = wix_image_to_url(url)
+        if reply.get('url') != native:
+            mismatches += 1
+            logging.warning(f'Parity mismatch for {url}: python={native} '
+                            f'node={reply}')
+    logging.info(f'Parity check: {len(urls)} URLs, {mismatches} mismatches')
+    print(f'Parity check: {len(urls)} URLs, {mismatches} mismatches')
+    return mismatches
+
+
+# Media srcs found in a products CSV
+def corpus_from_csv(csv_file):
+    with open(csv_file, mode='r', encoding='utf-8') as infile:
+        for row in csv.DictReader(infile):
+            try:
+                items = parse_nested(row.get('media items') or '[]')
+            except (ValueError, SyntaxError):
+                continue
+            for item in items:
+                yield item.get('src', '')
 
 
 if __name__ == '__main__':
-    process_csv(input_file, output_file)
+    parser = argparse.ArgumentParser(description='Convert media URLs in '
+                                                 'the products CSV')
+    parser.add_argument('--parity', nargs='?', const=input_file,
+                        metavar='CORPUS',
+                        help='compare the Python and Node converters on a '
+                             'products CSV or a file of one URL per line '
+                             'instead of converting')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='worker processes converting chunks of rows')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help='rows per chunk with --workers')
+    args = parser.parse_args()
+
+    if args.parity:
+        if args.parity.endswith('.csv'):
+            corpus = corpus_from_csv(args.parity)
+        else:
+            with open(args.parity, encoding='utf-8') as corpus_file:
+                corpus = [line.strip() for line in corpus_file]
+        sys.exit(1 if check_parity(corpus) else 0)
+
+    process_csv(input_file, output_file, args.workers,
+                max(1, args.chunk_size))
@@ -0,0 +1,127 @@
+import os
+import time
+import logging
+import argparse
+import resource
+import tempfile
+import multiprocessing
+import requests
+from wix_stub_server import start_server
+
+# Fetch modes measured by default: (name, entry point, options)
+SCENARIOS = [
+    ("fetch_wix_data", "fetch", {"workers": 1}),
+    ("fetch_wix_data x8", "fetch", {"workers": 8}),
+    ("stream", "stream", {"workers": 1}),
+    ("stream x8", "stream", {"workers": 8}),
+    ("stream cursor", "stream", {"by_cursor": True}),
+    ("stream compact x8", "stream", {"workers": 8, "compact": True}),
+    ("fetch_wix_product_url", "urls", {"workers": 1}),
+    ("fetch_wix_product_url compact x8", "urls",
+     {"workers": 8, "compact": True}),
+]
+
+
+# Run one scenario in a fresh process and report its numbers
+def run_scenario(api_url, entry, options, results):
+    """
+    Runs inside a child process, so the peak RSS it reports belongs to
+    this scenario alone. Output files go to a temporary directory.
+    """
+    import fetch_wix_data
+    fetch_wix_data.API_URL = api_url
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        started = time.monotonic()
+        if entry == "fetch":
+            items = len(fetch_wix_data.fetch_wix_data(**options)["items"])
+            ok = True
+        else:
+            sink = (fetch_wix_data.URLS_SINK if entry == "urls"
+                    else fetch_wix_data.PRODUCTS_SINK)
+            ok = fetch_wix_data.run_stream([sink], **options)
+            with open(sink.file_name, encoding="utf-8") as file:
+                items = sum(1 for _ in file) - 1
+        elapsed = time.monotonic() - started
+        limit = (fetch_wix_data.compact_params([sink])["limit"]
+                 if options.get("compact") else fetch_wix_data.PAGE_LIMIT)
+
+    results.put({
+        "ok": ok,
+        "items": items,
+        "pages": -(-items // limit),
+        "elapsed": elapsed,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss / 1024,
+    })
+
+
+def benchmark(catalog_size, latency, error_rate, scenarios=SCENARIOS):
+    server = start_server(catalog_size, latency, error_rate)
+    api_url = f"http://127.0.0.1:{server.server_address[1]}/"
+    context = multiprocessing.get_context("spawn")
+    report = []
+    try:
+        for name, entry, options in scenarios:
+            requests.get(f"{api_url}_reset")
+            results = context.Queue()
+            process = context.Process(target=run_scenario,
+                                      args=(api_url, entry, options,
+                                            results))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                logging.error(f"{name}: scenario crashed "
+                              f"(exit code {process.exitcode})")
+                continue
+            result = results.get()
+            stats = requests.get(f"{api_url}_stats").json()
+            result.update(name=name, requests=stats["requests"],
+                          errors=stats["errors"], retries=stats["retries"])
+            report.append(result)
+            logging.info(f"{name}: {result}")
+    finally:
+        server.shutdown()
+    return report
+
+
+def print_report(report):
+    print(f"{'scenario':<34} {'ok':>3} {'items':>7} {'pages/s':>8} "
+          f"{'items/s':>9} {'rss MB':>7} {'requests':>8} {'errors':>6} "
+          f"{'retries':>7}")
+    for row in report:
+        elapsed = row["elapsed"] or 1e-9
+        print(f"{row['name']:<34} {'y' if row['ok'] else 'n':>3} "
+              f"{row['items']:>7} {row['pages'] / elapsed:>8.1f} "
+              f"{row['items'] / elapsed:>9.0f} {row['peak_rss_mb']:>7.1f} "
+              f"{row['requests']:>8} {row['errors']:>6} "
+              f"{row['retries']:>7}")
+
+
+if __name__ == "__main__":
+    # Configure logging
+    logging.basicConfig(
+        filename="benchmark_fetch.log",
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    parser = argparse.ArgumentParser(description="Benchmark the Wix fetch "
+                                                 "against a local stub")
+    parser.add_argument("--items", type=int, default=5000,
+                        help="size of the synthetic catalog")
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="seconds added to every request")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of requests that fail")
+    parser.add_argument("--only", nargs="*", default=None,
+                        help="scenario names to run")
+    args = parser.parse_args()
+
+    scenarios = [scenario for scenario in SCENARIOS
+                 if not args.only or scenario[0] in args.only]
+    print_report(benchmark(args.items, args.latency, args.error_rate,
+                           scenarios))
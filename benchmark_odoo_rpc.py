@@ -0,0 +1,195 @@
+import os
+import ssl
+import time
+import base64
+import socket
+import logging
+import argparse
+import threading
+import socketserver
+from urllib.parse import urlparse
+from dotenv import load_dotenv
+from odoo_rpc import server_proxies
+
+load_dotenv()
+ODOO_URL = os.getenv('ODOO_URL')
+DB_NAME = os.getenv('DB_NAME')
+USERNAME = os.getenv('USERNAME')
+PASSWORD = os.getenv('PASSWORD')
+
+# Transports measured by default: (name, transport, gzip request bodies)
+TRANSPORTS = [
+    ("xmlrpc", "xmlrpc", False),
+    ("jsonrpc", "jsonrpc", False),
+]
+# Only measured with --gzip: stock Odoo does not inflate request bodies
+GZIP_TRANSPORT = ("jsonrpc+gzip", "jsonrpc", True)
+
+
+class CountingProxy(socketserver.ThreadingTCPServer):
+    """
+    Forwards local TCP connections to Odoo and counts the bytes that pass
+    in each direction, whatever the transport. HTTPS upstreams are
+    wrapped in TLS here, so the counts are of the plain HTTP traffic.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, upstream_url):
+        upstream = urlparse(upstream_url)
+        self.upstream_tls = upstream.scheme == "https"
+        self.upstream_host = upstream.hostname
+        self.upstream_port = upstream.port or (443 if self.upstream_tls
+                                               else 80)
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.received = 0
+        super().__init__(("127.0.0.1", 0), ProxyHandler)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def open_upstream(self):
+        sock = socket.create_connection((self.upstream_host,
+                                         self.upstream_port))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.upstream_tls:
+            sock = ssl.create_default_context().wrap_socket(
+                sock, server_hostname=self.upstream_host)
+        return sock
+
+    def count(self, sent=0, received=0):
+        with self.lock:
+            self.sent += sent
+            self.received += received
+
+    def reset(self):
+        with self.lock:
+            self.sent = self.received = 0
+
+
+class ProxyHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        upstream = self.server.open_upstream()
+        downstream = threading.Thread(target=self.pipe,
+                                      args=(upstream, self.request, False),
+                                      daemon=True)
+        downstream.start()
+        self.pipe(self.request, upstream, True)
+        downstream.join()
+        upstream.close()
+
+    def pipe(self, source, target, outgoing):
+        try:
+            while True:
+                data = source.recv(65536)
+                if not data:
+                    break
+                if outgoing:
+                    self.server.count(sent=len(data))
+                else:
+                    self.server.count(received=len(data))
+                target.sendall(data)
+        except OSError:
+            pass
+        finally:
+            try:
+                target.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+
+
+# Time `calls` calls of one kind over one transport
+def measure(proxy, transport, gzip_requests, calls, call):
+    common, models = server_proxies(proxy.url, transport, gzip_requests)
+    uid = common.authenticate(DB_NAME, USERNAME, PASSWORD, {})
+    if not uid:
+        raise RuntimeError("Failed to authenticate with Odoo.")
+    # Warm up the connection before counting
+    call(models, uid)
+    proxy.reset()
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    for _ in range(calls):
+        call(models, uid)
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    return {
+        "calls_per_s": calls / elapsed,
+        "cpu_ms": cpu / calls * 1000,
+        "sent_kb": proxy.sent / calls / 1024,
+        "received_kb": proxy.received / calls / 1024,
+    }
+
+
+def benchmark(calls, image_kb, image_file=None, with_gzip=False):
+    if image_file:
+        with open(image_file, "rb") as file:
+            image = file.read()
+    else:
+        # Random bytes compress like an already-compressed image
+        image = os.urandom(image_kb * 1024)
+    image_data = base64.b64encode(image).decode("utf-8")
+
+    # A small read, and a read-only call carrying an image-sized argument,
+    # so nothing in the database changes
+    workloads = [
+        ("small read", lambda models, uid: models.execute_kw(
+            DB_NAME, uid, PASSWORD, "res.users", "read", [[uid]],
+            {"fields": ["name"]})),
+        (f"{len(image) // 1024} KB image", lambda models, uid:
+            models.execute_kw(
+                DB_NAME, uid, PASSWORD, "product.template", "search_count",
+                [[["name", "=", image_data]]])),
+    ]
+    transports = TRANSPORTS + ([GZIP_TRANSPORT] if with_gzip else [])
+
+    proxy = CountingProxy(ODOO_URL)
+    report = []
+    try:
+        for workload, call in workloads:
+            for name, transport, gzip_requests in transports:
+                result = measure(proxy, transport, gzip_requests, calls, call)
+                result.update(workload=workload, transport=name)
+                report.append(result)
+                logging.info(f"{workload} over {name}: {result}")
+    finally:
+        proxy.shutdown()
+    return report
+
+
+def print_report(report):
+    print(f"{'workload':<16} {'transport':<13} {'calls/s':>8} "
+          f"{'cpu ms':>7} {'sent KB':>9} {'recv KB':>8}")
+    for row in report:
+        print(f"{row['workload']:<16} {row['transport']:<13} "
+              f"{row['calls_per_s']:>8.1f} {row['cpu_ms']:>7.2f} "
+              f"{row['sent_kb']:>9.1f} {row['received_kb']:>8.1f}")
+
+
+if __name__ == "__main__":
+    # Configure logging
+    logging.basicConfig(
+        filename="benchmark_odoo_rpc.log",
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    parser = argparse.ArgumentParser(description="Compare the XML-RPC and "
+                                                 "JSON-RPC transports "
+                                                 "against ODOO_URL")
+    parser.add_argument("--calls", type=int, default=50,
+                        help="calls per workload and transport")
+    parser.add_argument("--image-kb", type=int, default=500,
+                        help="size of the random image payload")
+    parser.add_argument("--image", default=None,
+                        help="send this file as the image payload instead")
+    parser.add_argument("--gzip", action="store_true",
+                        help="also measure gzip request bodies (needs a "
+                             "proxy in front of Odoo that inflates them)")
+    args = parser.parse_args()
+
+    print_report(benchmark(args.calls, args.image_kb, args.image, args.gzip))
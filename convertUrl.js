@@ -1,4 +1,6 @@
 const { media } = require('@wix/sdk');
+const readline = require('readline');
+
 async function convertUrls(internalUrls) {
   try {
     const urls = internalUrls.split(',').map((url) => url.trim());
@@ -15,7 +17,36 @@ async function convertUrls(internalUrls) {
   }
 }
 
-process.stdin.on('data', async (data) => {
-  const internalUrls = data.toString().trim();
-  await convertUrls(internalUrls);
-});
+// Worker mode: one internal URL per input line, one JSON reply per
+// output line ({"src": ..., "url": ...} or {"src": ..., "error": ...}),
+// in the same order, so a single process can convert any number of URLs.
+// Replies echo their input as "src" so the caller can check they line up.
+function serveLines() {
+  // Keep stdout for replies: anything else the SDK logs goes to stderr
+  console.log = console.error;
+  console.info = console.error;
+  console.warn = console.error;
+  const lines = readline.createInterface({
+    input: process.stdin,
+    terminal: false,
+  });
+  lines.on('line', (line) => {
+    const src = line.trim();
+    let reply;
+    try {
+      reply = { src, url: media.getImageUrl(src).url };
+    } catch (error) {
+      reply = { src, error: String((error && error.message) || error) };
+    }
+    process.stdout.write(`${JSON.stringify(reply)}\n`);
+  });
+}
+
+if (process.argv.includes('--lines')) {
+  serveLines();
+} else {
+  process.stdin.on('data', async (data) => {
+    const internalUrls = data.toString().trim();
+    await convertUrls(internalUrls);
+  });
+}
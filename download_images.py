@@ -1,11 +1,24 @@
 import os
 import csv
-import ast
 import requests
 import logging
+import argparse
+import time
+import queue
+import sqlite3
+import hashlib
+import threading
+import multiprocessing
+from collections import deque, namedtuple, Counter
+from functools import partial
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
 from PIL import Image
 from io import BytesIO
-import re
+from contextlib import ExitStack
+from nested_columns import parse_nested
 
 # Configure logging
 logging.basicConfig(
@@ -15,20 +28,503 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S"
 )
 
+# Concurrent downloads, and the most of them allowed against one host
+DOWNLOAD_WORKERS = 16
+PER_HOST_LIMIT = 8
+# Seconds to connect and to wait for each read
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 60
+# Encoder processes for pipelined mode (0 encodes on the download threads)
+# and how many downloaded images may wait for them
+ENCODE_WORKERS = os.cpu_count() or 1
+ENCODE_QUEUE_SIZE = 64
+# How much larger than the target a source is decoded or reduced to
+# before the final LANCZOS resample; 2.0 is indistinguishable from a full
+# resample in practice
+REDUCING_GAP = 2.0
+# Kept in the output folder: which file each source URL was saved as
+MANIFEST_FILE = "manifest.sqlite3"
+# Host whose /media/<id> URLs identify the media they serve
+WIX_MEDIA_HOST = "static.wixstatic.com"
 
-def sanitize_filename(name):
-    return re.sub(r'[\\/*?:"<>|]', "_", name)
+# What an earlier run saved for a source URL
+ManifestEntry = namedtuple("ManifestEntry",
+                           "filename etag last_modified sha256")
+# Outcome of one download task. `saved` is a bool, or a Future of one
+# while the image waits for an encoder process; `status` is one of
+# new, updated, unchanged, shared or failed.
+Download = namedtuple("Download",
+                      "saved filename etag last_modified sha256 status")
+FAILED = Download(False, None, None, None, None, "failed")
+
+
+class HostLimits:
+    """Caps the number of requests in flight to each host."""
+
+    def __init__(self, per_host=PER_HOST_LIMIT):
+        self.per_host = per_host
+        self.semaphores = {}
+        self.lock = threading.Lock()
+
+    def get(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.semaphores:
+                self.semaphores[host] = threading.BoundedSemaphore(
+                    self.per_host)
+            return self.semaphores[host]
+
+
+class ImageManifest:
+    """
+    Source URL -> saved image, kept in SQLite next to the images. Only the
+    main thread touches it; entries are committed as rows finish, so an
+    interrupted run loses nothing it already saved.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = None
+
+    def open(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS images ('
+                'url TEXT PRIMARY KEY, filename TEXT NOT NULL, '
+                'etag TEXT, last_modified TEXT, sha256 TEXT NOT NULL)')
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def load(self):
+        """Return {url: ManifestEntry} for every image saved so far."""
+        return {url: ManifestEntry(*entry) for url, *entry in
+                self.open().execute(
+                    'SELECT url, filename, etag, last_modified, sha256 '
+                    'FROM images ORDER BY rowid')}
+
+    def put_many(self, entries):
+        """Record [(url, ManifestEntry), ...]."""
+        with self.open() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?)',
+                [(url, *entry) for url, entry in entries])
+
+
+# Identify the media behind a URL
+def media_key(url):
+    """
+    Wix static URLs are named after their media ID, whatever transform
+    follows it; any other URL stands for itself.
+    """
+    parsed = urlparse(url)
+    if parsed.netloc == WIX_MEDIA_HOST and parsed.path.startswith("/media/"):
+        return parsed.path.split("/")[2]
+    return url
+
+
+class ImageStore:
+    """
+    Compressed images named after the SHA-256 of their source bytes, so
+    media shared by variants, bundles or several URLs is encoded and
+    stored once. Download threads claim a hash before encoding it; later
+    claims share the first one's result.
+    """
+
+    def __init__(self, output_folder, encode):
+        self.output_folder = output_folder
+        self.encode = encode
+        self.claims = {}
+        self.lock = threading.Lock()
+
+    def save(self, url, sha256, content):
+        """
+        Store `content` unless an image with the same bytes already is.
+        Returns (filename, saved, shared); `saved` is a bool or a Future.
+        """
+        filename = f"{sha256}.webp"
+        filepath = os.path.join(self.output_folder, filename)
+        with self.lock:
+            saved = self.claims.get(sha256)
+            if saved is not None:
+                return filename, saved, True
+            if os.path.exists(filepath):
+                self.claims[sha256] = True
+                return filename, True, True
+            saved = self.claims[sha256] = Future()
+        result = self.encode(url, content, filepath)
+        if isinstance(result, Future):
+            result.add_done_callback(
+                lambda result: saved.set_result(result.result()))
+        else:
+            saved.set_result(result)
+        return filename, saved, False
+
+
+# Resize and save an image as WebP
+def compress_image(content, filepath, max_width, quality):
+    """
+    Large sources are decoded near the target size first: JPEGs through
+    the decoder's DCT scaling (`draft`), other formats with a cheap
+    integer `reduce` before the final LANCZOS resample. WebP sources that
+    are already small enough are written out untouched.
+    """
+    # Open the image using Pillow
+    image = Image.open(BytesIO(content))
+
+    if image.format == "WEBP" and image.width <= max_width:
+        data = content
+    else:
+        # Resize image if it exceeds max width
+        if image.width > max_width:
+            aspect_ratio = image.height / image.width
+            new_height = int(max_width * aspect_ratio)
+            if image.format == "JPEG":
+                image.draft(image.mode, (max_width * REDUCING_GAP,
+                                         new_height * REDUCING_GAP))
+            image = image.resize((max_width, new_height),
+                                 Image.Resampling.LANCZOS,
+                                 reducing_gap=REDUCING_GAP)
+        output = BytesIO()
+        image.save(output, format="WEBP", quality=quality)
+        data = output.getvalue()
+
+    # Write a temporary file first so an interrupted run never leaves a
+    # truncated image behind
+    partial_path = f"{filepath}.part"
+    with open(partial_path, "wb") as file:
+        file.write(data)
+    os.replace(partial_path, filepath)
+
+
+# Compress an image on the calling thread
+def encode_inline(url, content, filepath, max_width, quality):
+    try:
+        compress_image(content, filepath, max_width, quality)
+        return True
+    except Exception as e:
+        logging.error(f"Error processing image from {url}: {e}")
+        return False
+
+
+# Download one image and put it in the store
+def download_image(session, host_limits, url, known, store):
+    """
+    `known` is the manifest entry for an image already on disk, or None.
+    Known images are revalidated with a conditional request and are only
+    stored again if their bytes changed.
+    """
+    headers = {}
+    if known:
+        if known.etag:
+            headers["If-None-Match"] = known.etag
+        if known.last_modified:
+            headers["If-Modified-Since"] = known.last_modified
+    try:
+        with host_limits.get(url):
+            response = session.get(url, headers=headers,
+                                   timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+    except requests.RequestException as e:
+        logging.error(f"Error processing image from {url}: {e}")
+        return FAILED
+
+    if known and response.status_code == 304:
+        return Download(True, known.filename,
+                        response.headers.get("ETag", known.etag),
+                        response.headers.get("Last-Modified",
+                                             known.last_modified),
+                        known.sha256, "unchanged")
+    if response.status_code != 200:
+        logging.warning(f"Failed to download {url}: "
+                        f"HTTP {response.status_code}")
+        return FAILED
+
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    sha256 = hashlib.sha256(response.content).hexdigest()
+    if known and known.sha256 == sha256:
+        return Download(True, known.filename, etag, last_modified, sha256,
+                        "unchanged")
+    filename, saved, shared = store.save(url, sha256, response.content)
+    status = "shared" if shared else "updated" if known else "new"
+    return Download(saved, filename, etag, last_modified, sha256, status)
+
+
+class EncodePipeline:
+    """
+    Download threads put raw image bytes on a bounded queue; one dispatcher
+    thread hands them to a pool of encoder processes. A full queue blocks
+    the downloaders, so memory stays bounded when encoding falls behind.
+    If an encoder process dies (e.g. OOM-killed on a huge source), the
+    jobs it took down fail and the rest are encoded on the dispatcher
+    thread instead.
+    """
+
+    def __init__(self, encoders, max_width, quality,
+                 queue_size=ENCODE_QUEUE_SIZE):
+        self.max_width = max_width
+        self.quality = quality
+        self.queue = queue.Queue(maxsize=queue_size)
+        # Processes are spawned rather than forked from a process that
+        # already runs download threads
+        self.executor = ProcessPoolExecutor(
+            max_workers=encoders,
+            mp_context=multiprocessing.get_context("spawn"))
+        # Keep every encoder busy with one job queued behind it
+        self.slots = threading.BoundedSemaphore(encoders * 2)
+        self.broken = False
+        self.lock = threading.Lock()
+        self.encoded = 0
+        self.failed = 0
+        self.bytes_in = 0
+        self.max_depth = 0
+        self.depth_total = 0
+        self.started = time.monotonic()
+        self.dispatcher = threading.Thread(target=self.dispatch, daemon=True)
+        self.dispatcher.start()
+
+    def submit(self, url, content, filepath):
+        """Queue `content` for encoding; the Future resolves to a bool."""
+        done = Future()
+        depth = self.queue.qsize()
+        with self.lock:
+            self.bytes_in += len(content)
+            self.max_depth = max(self.max_depth, depth)
+            self.depth_total += depth
+        self.queue.put((url, content, filepath, done))
+        return done
+
+    def dispatch(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            url, content, filepath, done = job
+            if self.broken:
+                self.encode_inline(url, content, filepath, done)
+                continue
+            self.slots.acquire()
+            try:
+                encoding = self.executor.submit(compress_image, content,
+                                                filepath, self.max_width,
+                                                self.quality)
+            except BrokenProcessPool as e:
+                self.slots.release()
+                self.mark_broken(e)
+                self.encode_inline(url, content, filepath, done)
+                continue
+            except Exception as e:
+                self.finish(url, done, e)
+                continue
+            encoding.add_done_callback(
+                lambda encoding, url=url, done=done:
+                    self.finish(url, done, encoding.exception()))
+
+    def mark_broken(self, error):
+        if not self.broken:
+            self.broken = True
+            logging.error(f"Encoder pool stopped ({error}); encoding the "
+                          f"remaining images inline")
+
+    def encode_inline(self, url, content, filepath, done):
+        try:
+            compress_image(content, filepath, self.max_width, self.quality)
+            error = None
+        except Exception as e:
+            error = e
+        self.record(url, done, error)
+
+    def finish(self, url, done, error):
+        self.slots.release()
+        if isinstance(error, BrokenProcessPool):
+            self.mark_broken(error)
+        self.record(url, done, error)
+
+    def record(self, url, done, error):
+        with self.lock:
+            if error is None:
+                self.encoded += 1
+            else:
+                self.failed += 1
+        if error is not None:
+            logging.error(f"Error processing image from {url}: {error}")
+        done.set_result(error is None)
+
+    def stats(self):
+        with self.lock:
+            submitted = self.encoded + self.failed
+            elapsed = (time.monotonic() - self.started) or 1e-9
+            return (f"{self.encoded} encoded, {self.failed} failed, "
+                    f"{self.encoded / elapsed:.1f} images/s, "
+                    f"{self.bytes_in / elapsed / 1e6:.1f} MB/s downloaded, "
+                    f"queue depth {self.queue.qsize()} now, "
+                    f"{self.depth_total / max(submitted, 1):.1f} avg, "
+                    f"{self.max_depth} max")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.queue.put(None)
+        self.dispatcher.join()
+        self.executor.shutdown()
+        logging.info(f"Encode pipeline: {self.stats()}")
+
+
+# Whether a download ended with the image saved
+def image_saved(download):
+    saved = download.saved
+    if isinstance(saved, Future):
+        saved = saved.result()
+    return saved
+
+
+# Read the sizes out of the 'product options' column
+def sizes_from_options(product_options):
+    product_options = product_options.strip()
+    if not product_options or product_options == "{}":
+        return ""
+    try:
+        options = parse_nested(product_options)
+        normalized_options = {k.strip().lower(): v for k, v
+                              in options.items()}
+        size_choices = normalized_options.get(
+                                              "size", {}).get(
+                                              "choices", [])
+        sizes = [choice["value"] for choice in size_choices
+                 if "value" in choice]
+        return ",".join(sizes) if sizes else ""
+    except (SyntaxError, ValueError):
+        logging.error(f"Invalid format in 'product options': "
+                      f"{product_options}")
+        return ""
 
 
 def download_and_compress_images(csv_file, output_folder, max_width=800,
-                                 quality=85):
+                                 quality=85, workers=DOWNLOAD_WORKERS,
+                                 per_host=PER_HOST_LIMIT, encoders=0):
+    """
+    Download every media URL in the CSV with `workers` threads sharing a
+    keep-alive session (at most `per_host` per host), compress them to
+    WebP and record the file names back in the CSV. Rows are finished in
+    order while later rows' downloads are still running. With `encoders`
+    > 0, compression runs in that many processes instead of on the
+    download threads.
+
+    Images are stored once per distinct source (see ImageStore) and every
+    row that uses one refers to the same file. What was saved is
+    recorded in MANIFEST_FILE in `output_folder`, so a re-run only
+    revalidates images it already has and resumes where an interrupted
+    run stopped.
+    """
     # Create the output folder if it doesn't exist
     os.makedirs(output_folder, exist_ok=True)
 
     updated_rows = []
+    image_count = 0
+    download_stats = Counter()
+
+    manifest_db = ImageManifest(os.path.join(output_folder, MANIFEST_FILE))
+    manifest = manifest_db.load()
+    # Media key -> the download fetching it, so media repeated across rows
+    # is only fetched once
+    scheduled = {}
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    host_limits = HostLimits(per_host)
+    pipeline = (EncodePipeline(encoders, max_width, quality) if encoders
+                else None)
+    store = ImageStore(output_folder, pipeline.submit if pipeline else
+                       partial(encode_inline, max_width=max_width,
+                               quality=quality))
+
+    # Rows whose downloads were submitted, oldest first, as
+    # (row, [(idx, url, future, first), ...]); `first` is False where the
+    # row reuses a download scheduled for an earlier reference
+    pending = deque()
+
+    def finish_row():
+        nonlocal image_count
+        row, downloads = pending.popleft()
+        extra_images = []
+        entries = []
+        for idx, url, future, first in downloads:
+            download = future.result()
+            saved = image_saved(download)
+            if first:
+                download_stats[download.status if saved else "failed"] += 1
+            elif saved:
+                download_stats["shared"] += 1
+            if not saved:
+                continue
+            if first:
+                entries.append((url, ManifestEntry(
+                    download.filename, download.etag,
+                    download.last_modified, download.sha256)))
+                image_count += 1
+                if image_count % 100 == 0:
+                    logging.info(f"Downloaded and compressed: "
+                                 f"{image_count} images")
+                    if pipeline:
+                        logging.info(f"Encode pipeline: "
+                                     f"{pipeline.stats()}")
+            if idx == 0:
+                row['Image'] = download.filename
+            elif (download.filename != row['Image']
+                    and download.filename not in extra_images):
+                extra_images.append(download.filename)
+        row['extra_images'] = ";".join(extra_images)
+        updated_rows.append(row)
+        if entries:
+            manifest_db.put_many(entries)
+
+    def record_unfinished():
+        # After an interruption, record what was saved for rows that never
+        # finished so the next run doesn't fetch those images again
+        entries = []
+        for row, downloads in pending:
+            for idx, url, future, first in downloads:
+                download = future.result()
+                if first and image_saved(download):
+                    entries.append((url, ManifestEntry(
+                        download.filename, download.etag,
+                        download.last_modified, download.sha256)))
+        if entries:
+            manifest_db.put_many(entries)
 
     # Open the CSV file
-    with open(csv_file, mode="r", encoding="utf-8") as file:
+    with ExitStack() as stack:
+        file = stack.enter_context(open(csv_file, mode="r",
+                                        encoding="utf-8"))
+        stack.enter_context(session)
+        stack.enter_context(manifest_db)
+        # Runs once every download and encode below has stopped
+        stack.callback(record_unfinished)
+        # Entered before the thread pool so it closes after the last
+        # download has been queued
+        if pipeline:
+            stack.enter_context(pipeline)
+        executor = stack.enter_context(
+            ThreadPoolExecutor(max_workers=workers))
         reader = csv.DictReader(file)
 
         if reader.fieldnames is None:
@@ -36,93 +532,54 @@ def download_and_compress_images(csv_file, output_folder, max_width=800,
                              "has an invalid format.")
         # Read fieldnames
         fieldnames = reader.fieldnames
+        in_flight = 0
         # Loop through each row in the CSV
-        image_count = 0
         for row in reader:
-            product_name = row["Name"].replace(" ", "_").lower()
-            product_name = sanitize_filename(product_name)
-            # Add sanitised name to the row
-            row['Image'] = (
-                product_name + '_1.webp' if not
-                product_name.endswith('_1.webp') else product_name)
+            # Set to the first image's file once it is saved
+            row['Image'] = ""
 
             media_items = row.get("media items", "")
 
             # Split the media items column into individual URLs
             media_urls = media_items.split(",") if media_items else []
-            extra_images = []
+            downloads = []
             for idx, url in enumerate(media_urls):
-                try:
-                    url = url.strip()  # Remove any extra spaces
-                    if url and url.startswith("http"):
-                        response = requests.get(url)
-
-                        if response.status_code == 200:
-                            # Create a filename using the product name
-                            # and index
-                            filename = f"{product_name}_{idx + 1}.webp"
-                            filepath = os.path.join(output_folder, filename)
-
-                            # Ensure unique filename
-                            counter = 1
-                            while os.path.exists(filepath):
-                                filename = (
-                                    f"{product_name}_{idx + 1}_"
-                                    f"{counter}.webp"
-                                )
-                                filepath = os.path.join(
-                                            output_folder,
-                                            filename
-                                )
-                                counter += 1
-                            if idx > 0:
-                                extra_images.append(filename)
-
-                            # Open the image using Pillow
-                            image = Image.open(BytesIO(response.content))
-
-                            # Resize image if it exceeds max width
-                            if image.width > max_width:
-                                aspect_ratio = image.height / image.width
-                                new_height = int(max_width * aspect_ratio)
-                                image = image.resize((max_width, new_height),
-                                                     Image.Resampling.LANCZOS)
-
-                            # Save the image with compression
-                            image.save(filepath, format="WEBP",
-                                       quality=quality)
-                            image_count += 1
-                            if image_count % 100 == 0:
-                                logging.info(f"Downloaded and compressed: "
-                                             f"{image_count} images")
-                        else:
-                            logging.warning(f"Failed to download {url}: "
-                                            f"HTTP {response.status_code}")
-                except Exception as e:
-                    logging.error(f"Error processing image from {url}: {e}")
-            row['extra_images'] = ";".join(extra_images)
-            product_options = row.get("product options", "{}").strip()
-
-            if product_options and product_options != "{}":
-                try:
-                    options = ast.literal_eval(product_options)
-                    normalized_options = {k.strip().lower(): v for k, v
-                                          in options.items()}
-                    size_choices = normalized_options.get(
-                                                          "size", {}).get(
-                                                          "choices", [])
-                    sizes = [choice["value"] for choice in size_choices
-                             if "value" in choice]
-                    row['Size'] = ",".join(sizes) if sizes else ""
-                except (SyntaxError, ValueError):
-                    logging.error(f"Invalid format in 'product options': "
-                                  f"{product_options}")
-                    row['Size'] = ""
-            else:
-                row['Size'] = ""
-            updated_rows.append(row)
+                url = url.strip()  # Remove any extra spaces
+                if not url or not url.startswith("http"):
+                    continue
+                key = media_key(url)
+                future = scheduled.get(key)
+                if future is not None:
+                    downloads.append((idx, url, future, False))
+                    continue
+                known = manifest.get(url)
+                if known and not os.path.exists(
+                        os.path.join(output_folder, known.filename)):
+                    known = None
+                future = executor.submit(download_image, session,
+                                         host_limits, url, known, store)
+                scheduled[key] = future
+                downloads.append((idx, url, future, True))
+                in_flight += 1
+
+            row['Size'] = sizes_from_options(
+                row.get("product options", "{}"))
+            pending.append((row, downloads))
+
+            # Keep a bounded window of submitted downloads
+            while pending and in_flight > workers * 4:
+                in_flight -= sum(first for *_, first in pending[0][1])
+                finish_row()
+        while pending:
+            finish_row()
+
     logging.info(f"Total images downloaded and compressed: "
-                 f"{image_count}")
+                 f"{image_count} ({download_stats['new']} new, "
+                 f"{download_stats['updated']} updated, "
+                 f"{download_stats['unchanged']} unchanged, "
+                 f"{download_stats['failed']} failed); "
+                 f"{download_stats['shared']} references to an image "
+                 f"already stored")
 
     with open(csv_file, mode='w', encoding='utf-8', newline='') as file:
         writer = csv.DictWriter(file, fieldnames=fieldnames)
@@ -131,9 +588,25 @@ def download_and_compress_images(csv_file, output_folder, max_width=800,
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download and compress "
+                                                 "product images")
+    parser.add_argument("--workers", type=int, default=DOWNLOAD_WORKERS,
+                        help="concurrent downloads")
+    parser.add_argument("--per-host", type=int, default=PER_HOST_LIMIT,
+                        help="concurrent downloads allowed per host")
+    parser.add_argument("--encoders", type=int, nargs="?", default=0,
+                        const=ENCODE_WORKERS,
+                        help="encode in this many processes (one per CPU "
+                             "if no number is given) while downloads "
+                             "continue; 0 encodes inline")
+    args = parser.parse_args()
+
     # Specify the input CSV file and output folder for images
     input_csv = "products_with_absolute_urls.csv"
     output_folder = "compressed_images"
 
     # Call the function to download and compress images
-    download_and_compress_images(input_csv, output_folder)
+    download_and_compress_images(input_csv, output_folder,
+                                 workers=max(1, args.workers),
+                                 per_host=max(1, args.per_host),
+                                 encoders=max(0, args.encoders))
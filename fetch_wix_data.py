@@ -1,64 +1,470 @@
 import requests
 import csv
 import os
+import json
+import time
+import random
 import logging
+import threading
+import argparse
+from collections import namedtuple
+from contextlib import ExitStack
+from functools import lru_cache
+from html.parser import HTMLParser
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
-from bs4 import BeautifulSoup
-
-# Configure logging
-logging.basicConfig(
-    filename="fetch_wix_data.log",
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
 
 load_dotenv()
 # Define the API endpoint and authorization token
 API_URL = os.getenv('API_URL')
-PAGE_LIMIT = 20
+PAGE_LIMIT = int(os.getenv('PAGE_LIMIT', '20'))
+# Page size for --compact runs of outputs whose projected items are small;
+# outputs that still need descriptions, media or options keep PAGE_LIMIT
+COMPACT_PAGE_LIMIT = int(os.getenv('COMPACT_PAGE_LIMIT', '200'))
+# Number of page requests kept in flight
+PAGE_WORKERS = int(os.getenv('PAGE_WORKERS', '1'))
+REQUEST_TIMEOUT = 60
+# Retries per page for timeouts, connection errors and RETRY_STATUSES,
+# with exponential backoff from BACKOFF_BASE up to BACKOFF_MAX seconds
+MAX_RETRIES = int(os.getenv('MAX_RETRIES', '5'))
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Requests per second across all workers; 0 means no limit
+RATE_LIMIT = float(os.getenv('RATE_LIMIT', '0'))
+# Records the last page committed to the CSV by --stream runs
+CHECKPOINT_FILE = "fetch_wix_data.checkpoint"
+# Highest _updatedDate seen, used by --incremental runs
+WATERMARK_FILE = "fetch_wix_data.watermark"
+# Distinct descriptions kept by the HTML stripping cache
+HTML_CACHE_SIZE = 4096
+# How "product options" and "media items" are written: "repr" (Python
+# literals, the original format) or "json"
+NESTED_FORMAT = os.getenv('NESTED_FORMAT', 'repr')
 
+# Define CSV column headers
+PRODUCT_HEADERS = ["External ID", "Name", "inStock", "product options",
+                   "Sales Description", "Product Type",
+                   "Sales Price", "brand", "description_ecommerce",
+                   "media items", "created date", 'is_storable',
+                   "Image", "extra_images", "description_ecommerce", "Size",
+                   "allow_out_of_stock_order", "is_published",
+                   "available_in_pos", "Point of Sale Category"]
+URL_HEADERS = ["wix_product_url", "Name", 'created_date', 'slug']
 
-# Fetch data from Wix
-def fetch_wix_data():
+# Wix item fields each output reads; _id and _updatedDate are always
+# needed for cursor paging and the watermark
+PRODUCT_FIELDS = ["_id", "_updatedDate", "name", "inStock",
+                  "productOptions", "description", "discountedPrice",
+                  "brand", "mediaItems", "createdDate"]
+URL_FIELDS = ["_id", "_updatedDate", "productPageUrl", "name",
+              "createdDate", "slug"]
+
+# A CSV output fed by the fetch: file, column headers, row builder, the
+# column that identifies a row when merging incremental updates, the
+# Wix fields the row builder reads and the page size to use when only
+# those fields are requested
+CsvSink = namedtuple("CsvSink", ["file_name", "headers", "build_row", "key",
+                                 "fields", "compact_limit"])
+
+
+class RequestThrottle:
+    """
+    Shared by the page workers: a token bucket holding requests to
+    `rate` per second, a pause every worker honours after a Retry-After,
+    and the retry count. When throttled the rate is halved, and each
+    success adds back a small step up to the configured rate.
+    """
+
+    def __init__(self, rate=RATE_LIMIT):
+        self.max_rate = rate or None
+        self.rate = self.max_rate
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.retries = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                delay = self.paused_until - now
+                if delay <= 0:
+                    if not self.rate:
+                        return
+                    self.tokens = min(max(1.0, self.rate), self.tokens +
+                                      (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+    def retrying(self, delay, throttled):
+        with self.lock:
+            self.retries += 1
+            if throttled:
+                self.paused_until = max(self.paused_until,
+                                        time.monotonic() + delay)
+                if self.rate:
+                    self.rate = max(self.max_rate / 64, self.rate / 2)
+
+    def succeeded(self):
+        if self.rate and self.rate < self.max_rate:
+            with self.lock:
+                self.rate = min(self.max_rate,
+                                self.rate + self.max_rate / 50)
+
+
+# Seconds asked for by a Retry-After header, if any
+def retry_after(response):
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# Exponential backoff with full jitter
+def backoff_delay(attempt):
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+# Fetch a single page from the storeListing endpoint
+def fetch_page(session, page, params=None, throttle=None):
+    """
+    GET one page, retrying timeouts, connection errors and
+    RETRY_STATUSES up to MAX_RETRIES times. A Retry-After header sets
+    the delay; otherwise it backs off exponentially with jitter.
+    """
+    query = {"page": page, "limit": PAGE_LIMIT, **(params or {})}
+    throttle = throttle or RequestThrottle()
+    for attempt in range(MAX_RETRIES + 1):
+        throttle.wait()
+        try:
+            response = session.get(API_URL, params=query,
+                                   timeout=REQUEST_TIMEOUT)
+        except (requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout) as e:
+            if attempt == MAX_RETRIES:
+                raise
+            reason = str(e)
+            delay = backoff_delay(attempt)
+            throttled = False
+        else:
+            if (response.status_code not in RETRY_STATUSES
+                    or attempt == MAX_RETRIES):
+                response.raise_for_status()
+                throttle.succeeded()
+                return response.json()
+            reason = f"HTTP {response.status_code}"
+            delay = retry_after(response)
+            throttled = response.status_code == 429 or delay is not None
+            if delay is None:
+                delay = backoff_delay(attempt)
+
+        logging.warning(f"Page {page} failed ({reason}), retry "
+                        f"{attempt + 1}/{MAX_RETRIES} in {delay:.1f}s")
+        throttle.retrying(delay, throttled)
+        time.sleep(delay)
+
+
+# Validate a page response, returning its items or None to stop
+def page_items(data, page):
+    if not data:
+        logging.warning('Api returned an empty response.')
+        return None
+
+    if not isinstance(data, dict) or 'items' not in data:
+        logging.warning(f"Unexpected response format on"
+                        f"page {page}: {data}")
+        return None
+
+    return data.get("items", [])
+
+
+# Walk the Wix pages
+def iter_wix_pages(workers=PAGE_WORKERS, start_page=0, params=None):
+    """
+    Yield (page, items) for every page from `start_page` on, keeping up
+    to `workers` page requests in flight on a pooled session. Pages are
+    yielded in order, so only the in-flight window is ever held in
+    memory. `params` are extra query parameters such as `since`.
+    Request errors are logged and re-raised.
+    """
     # headers = {"Authorization": f"Bearer {AUTH_TOKEN}"}
-    all_items = []
-    page = 0
-    while True:
+    page = start_page
+    next_page = start_page
+    item_count = 0
+    pending = {}
+    throttle = RequestThrottle()
+    started = time.monotonic()
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    with session, ThreadPoolExecutor(max_workers=workers) as executor:
         try:
-            paginated_url = f"{API_URL}?page={page}&limit={PAGE_LIMIT}"
-            response = requests.get(paginated_url)
-            response.raise_for_status()
+            while True:
+                # Keep the window full; pages past the last one come back
+                # empty and are discarded once hasNext goes false
+                while len(pending) < workers:
+                    pending[next_page] = executor.submit(
+                        fetch_page, session, next_page, params, throttle)
+                    next_page += 1
+                try:
+                    data = pending.pop(page).result()
+                except requests.exceptions.RequestException as e:
+                    logging.error(f"Error fetching data on page {page}: {e}")
+                    raise
+
+                items = page_items(data, page)
+                if items is None:
+                    break
+                item_count += len(items)
+                logging.info(f"Fetched page {page}, items: {len(items)}")
+                yield page, items
+                page += 1
+                if not data.get("hasNext", False):
+                    break
+        finally:
+            for future in pending.values():
+                future.cancel()
+            elapsed = time.monotonic() - started
+            rate = (page - start_page) / elapsed if elapsed else 0.0
+            logging.info(f"Fetched {item_count} items from "
+                         f"{page - start_page} pages in {elapsed:.1f}s "
+                         f"({rate:.2f} pages/sec, workers={workers}, "
+                         f"retries={throttle.retries})")
+
+
+# Walk the Wix pages by keyset cursor
+def iter_wix_cursor_pages(cursor="", start_page=0, params=None):
+    """
+    Yield (page, items) by following `nextCursor` from `cursor` (empty
+    for the first page). The endpoint filters on `_id` instead of
+    skipping rows, so late pages cost the same as early ones; each page
+    depends on the previous one, so requests are made one at a time.
+    """
+    page = start_page
+    item_count = 0
+    throttle = RequestThrottle()
+    started = time.monotonic()
+
+    with requests.Session() as session:
+        try:
+            while True:
+                try:
+                    data = fetch_page(session, page,
+                                      {**(params or {}), "cursor": cursor},
+                                      throttle)
+                except requests.exceptions.RequestException as e:
+                    logging.error(f"Error fetching data on page {page} "
+                                  f"(cursor {cursor!r}): {e}")
+                    raise
+
+                items = page_items(data, page)
+                if items is None:
+                    break
+                item_count += len(items)
+                logging.info(f"Fetched page {page}, items: {len(items)}")
+                yield page, items
+                page += 1
+                cursor = data.get("nextCursor")
+                if not data.get("hasNext", False) or not cursor:
+                    break
+        finally:
+            elapsed = time.monotonic() - started
+            rate = (page - start_page) / elapsed if elapsed else 0.0
+            logging.info(f"Fetched {item_count} items from "
+                         f"{page - start_page} pages in {elapsed:.1f}s "
+                         f"({rate:.2f} pages/sec, cursor paging, "
+                         f"retries={throttle.retries})")
 
-            data = response.json()
-            if not data:
-                logging.warning('Api returned an empty response.')
-                break
 
-            if not isinstance(data, dict) or 'items' not in data:
-                logging.warning(f"Unexpected response format on"
-                                f"page {page}: {data}")
-                break
+# Page or cursor walk, depending on the mode
+def iter_pages(workers=PAGE_WORKERS, by_cursor=False, start_page=0,
+               cursor="", params=None):
+    if by_cursor:
+        if workers > 1:
+            logging.info("Cursor paging is sequential, ignoring workers")
+        return iter_wix_cursor_pages(cursor, start_page, params)
+    return iter_wix_pages(workers, start_page, params)
 
-            items = data.get("items", [])
 
+# Fetch data from Wix
+def fetch_wix_data(workers=PAGE_WORKERS, by_cursor=False, params=None):
+    all_items = []
+    try:
+        for _, items in iter_pages(workers, by_cursor, params=params):
             all_items.extend(items)
-            logging.info(f"Fetched page {page}, items: {len(items)}")
-            if not data.get("hasNext", False):
-                break
-            page += 1
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Error fetching data: {e}")
-            break
-    logging.info(f"Fetched {len(all_items)} items")
+    except requests.exceptions.RequestException:
+        # Keep what we have; --stream runs can be resumed instead
+        logging.warning(f"Returning {len(all_items)} items fetched before "
+                        f"the error")
     return {"items": all_items}
 
 
+# Highest _updatedDate among items, starting from `watermark`
+def max_updated_date(items, watermark=None):
+    dates = [item["_updatedDate"] for item in items
+             if item.get("_updatedDate")]
+    if watermark:
+        dates.append(watermark)
+    return max(dates) if dates else None
+
+
+# Read the watermark saved by the last complete fetch
+def load_watermark(watermark_file=WATERMARK_FILE):
+    if not os.path.exists(watermark_file):
+        return None
+    with open(watermark_file, encoding="utf-8") as file:
+        return file.read().strip() or None
+
+
+def save_watermark(watermark, watermark_file=WATERMARK_FILE):
+    if not watermark:
+        return
+    with open(watermark_file, mode="w", encoding="utf-8") as file:
+        file.write(watermark)
+    logging.info(f"Saved watermark {watermark}")
+
+
+# Read the checkpoint left by an interrupted --stream run
+def load_checkpoint(checkpoint_file=CHECKPOINT_FILE):
+    if not os.path.exists(checkpoint_file):
+        return None
+    try:
+        with open(checkpoint_file, encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError) as e:
+        logging.error(f"Unreadable checkpoint {checkpoint_file}: {e}")
+        return None
+
+
+# Atomically record the last page committed to the CSV
+def save_checkpoint(checkpoint, checkpoint_file=CHECKPOINT_FILE):
+    tmp_file = f"{checkpoint_file}.tmp"
+    with open(tmp_file, mode="w", encoding="utf-8") as file:
+        json.dump(checkpoint, file)
+    os.replace(tmp_file, checkpoint_file)
+
+
+class TextExtractor(HTMLParser):
+    """
+    Collects the text of an HTML fragment in one streaming pass, with
+    entities decoded and script/style contents skipped, matching
+    BeautifulSoup's get_text() without building a tree.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("script", "style", "template"):
+            self.skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style", "template") and self.skip_depth:
+            self.skip_depth -= 1
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.parts.append(data)
+
+    def unknown_decl(self, data):
+        if data.startswith("CDATA[") and not self.skip_depth:
+            self.parts.append(data[len("CDATA["):])
+
+
+# Descriptions repeat across variants, so cache the stripped text
+@lru_cache(maxsize=HTML_CACHE_SIZE)
+def strip_html(text):
+    extractor = TextExtractor()
+    extractor.feed(text)
+    extractor.close()
+    return "".join(extractor.parts).strip()
+
+
 # Remove HTML tags from description
 def remove_html_tags(text):
     if text is None:
         return ""
-    soup = BeautifulSoup(text, 'html.parser')
-    return soup.get_text().strip()
+    return strip_html(text)
+
+
+# Serialise a nested value for a CSV cell
+def nested_value(value):
+    if value in ("", None):
+        return ""
+    if NESTED_FORMAT == "json":
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    return value
+
+
+# Map a Wix item to a products.csv row
+def product_row(item):
+    description = remove_html_tags(item.get("description", ""))
+    return {
+        "External ID": item["_id"],
+        "Name": item.get("name", ""),
+        "inStock": item.get("inStock", ""),
+        "product options": nested_value(item.get("productOptions", "")),
+        "Sales Description": description,
+        "Product Type": "Goods",
+        "Sales Price": item.get("discountedPrice", 0),
+        "brand": item.get("brand", ""),
+        "description_ecommerce": description,
+        "media items": nested_value(item.get("mediaItems", "")),
+        "created date": item.get("createdDate", ""),
+        "is_storable": "True",
+        "Image": "",
+        "extra_images": "",
+        "Size": "",
+        "allow_out_of_stock_order": item.get("inStock", ""),
+        "is_published": "true",
+        "available_in_pos": item.get("inStock", ""),
+        "Point of Sale Category": "All",
+    }
+
+
+# Map a Wix item to a products_urls.csv row
+def url_row(item):
+    return {
+        "wix_product_url": item["productPageUrl"],
+        "Name": item.get("name", ""),
+        "created_date": item.get("createdDate", ""),
+        "slug": item.get("slug", ""),
+    }
+
+
+# Product items keep their description, media and options, which are most
+# of the payload, so projecting them doesn't make larger pages safe
+PRODUCTS_SINK = CsvSink("products.csv", PRODUCT_HEADERS, product_row,
+                        "External ID", PRODUCT_FIELDS, PAGE_LIMIT)
+URLS_SINK = CsvSink("products_urls.csv", URL_HEADERS, url_row,
+                    "wix_product_url", URL_FIELDS, COMPACT_PAGE_LIMIT)
+
+
+# Query parameters asking only for the fields the sinks use
+def compact_params(sinks):
+    fields = sorted({field for sink in sinks for field in sink.fields})
+    limit = min(sink.compact_limit for sink in sinks)
+    return {"fields": ",".join(fields), "limit": limit}
 
 
 # Save data to CSV
@@ -68,46 +474,15 @@ def save_to_csv(data, file_name="products.csv"):
         logging.error("No data to save.Exiting")
         return
 
-    # Define CSV column headers
-    headers = ["External ID", "Name", "inStock", "product options",
-               "Sales Description", "Product Type",
-               "Sales Price", "brand", "description_ecommerce",
-               "media items", "created date", 'is_storable',
-               "Image", "extra_images", "description_ecommerce", "Size",
-               "allow_out_of_stock_order", "is_published", "available_in_pos",
-               "Point of Sale Category"]
-
     with open(file_name, mode="w", newline="", encoding="utf-8") as file:
-        writer = csv.DictWriter(file, fieldnames=headers)
+        writer = csv.DictWriter(file, fieldnames=PRODUCT_HEADERS)
         writer.writeheader()
 
         row_count = 0
         for item in data:
             # if number == 50:
             #    break
-            writer.writerow({
-                "External ID": item["_id"],
-                "Name": item.get("name", ""),
-                "inStock": item.get("inStock", ""),
-                "product options": item.get("productOptions", ""),
-                "Sales Description": remove_html_tags(
-                    item.get("description", "")),
-                "Product Type": "Goods",
-                "Sales Price": item.get("discountedPrice", 0),
-                "brand": item.get("brand", ""),
-                "description_ecommerce": remove_html_tags(
-                    item.get("description", "")),
-                "media items": item.get("mediaItems", ""),
-                "created date": item.get("createdDate", ""),
-                "is_storable": "True",
-                "Image": "",
-                "extra_images": "",
-                "Size": "",
-                "allow_out_of_stock_order": item.get("inStock", ""),
-                "is_published": "true",
-                "available_in_pos": item.get("inStock", ""),
-                "Point of Sale Category": "All",
-            })
+            writer.writerow(product_row(item))
             row_count += 1
             if row_count % 100 == 0:
                 logging.info(f"Processed {row_count} rows...")
@@ -116,9 +491,213 @@ def save_to_csv(data, file_name="products.csv"):
     logging.info(f"Processed {row_count} rows. Data saved to {file_name}")
 
 
+# Stream pages straight to CSV
+def stream_to_csv(pages, sinks, checkpoint_file=CHECKPOINT_FILE,
+                  checkpoint=None, by_cursor=False, params=None):
+    """
+    Fan each (page, items) pair from `pages` out to every CsvSink as soon
+    as it arrives, flushing after every page, so nothing is accumulated
+    in memory and the store is crawled once for all outputs.
+    After each page the checkpoint records the page, every file size and
+    the watermark so far, plus the last `_id` when paging `by_cursor`
+    and the query `params` the pages were fetched with; passing that
+    checkpoint back appends to the files after trimming any rows written
+    past it. The checkpoint is removed on success and the watermark
+    returned.
+    """
+    watermark = checkpoint.get("watermark") if checkpoint else None
+    cursor = checkpoint.get("cursor", "") if checkpoint else ""
+    with ExitStack() as stack:
+        outputs = []
+        for sink in sinks:
+            if checkpoint:
+                # Drop rows from a page that was written but never
+                # committed
+                with open(sink.file_name, mode="r+b") as file:
+                    file.truncate(checkpoint["offsets"][sink.file_name])
+                mode = "a"
+            else:
+                mode = "w"
+            file = stack.enter_context(open(sink.file_name, mode=mode,
+                                            newline="", encoding="utf-8"))
+            writer = csv.DictWriter(file, fieldnames=sink.headers)
+            if not checkpoint:
+                writer.writeheader()
+            outputs.append((sink, file, writer))
+
+        row_count = 0
+        for page, items in pages:
+            offsets = {}
+            for sink, file, writer in outputs:
+                writer.writerows(sink.build_row(item) for item in items)
+                file.flush()
+                offsets[sink.file_name] = file.tell()
+            watermark = max_updated_date(items, watermark)
+            committed = {"page": page, "offsets": offsets,
+                         "watermark": watermark, "params": params}
+            if by_cursor:
+                cursor = items[-1]["_id"] if items else cursor
+                committed["cursor"] = cursor
+            save_checkpoint(committed, checkpoint_file)
+            row_count += len(items)
+            logging.info(f"Wrote page {page}, {row_count} rows so far")
+
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+    for sink in sinks:
+        logging.info(f"Processed {row_count} rows. "
+                     f"Data saved to {sink.file_name}")
+    return watermark
+
+
+# Merge updated items into an existing CSV
+def merge_into_csv(sink, items):
+    """
+    Replace the rows of `sink.file_name` whose key matches an updated
+    item and append the rest, streaming the existing file through a
+    temporary copy so only the changed rows are held in memory.
+    """
+    updates = {}
+    for item in items:
+        row = sink.build_row(item)
+        updates[row[sink.key]] = row
+
+    tmp_file = f"{sink.file_name}.tmp"
+    replaced = 0
+    with open(tmp_file, mode="w", newline="", encoding="utf-8") as outfile:
+        writer = csv.DictWriter(outfile, fieldnames=sink.headers)
+        writer.writeheader()
+        if os.path.exists(sink.file_name):
+            with open(sink.file_name, mode="r", encoding="utf-8") as infile:
+                for row in csv.DictReader(infile):
+                    update = updates.pop(row.get(sink.key), None)
+                    if update is not None:
+                        replaced += 1
+                    writer.writerow(update or row)
+        writer.writerows(updates.values())
+    os.replace(tmp_file, sink.file_name)
+    logging.info(f"Merged into {sink.file_name}: {replaced} updated, "
+                 f"{len(updates)} added")
+
+
+# Streamed fetch, optionally resumed from the checkpoint
+def run_stream(sinks, workers=PAGE_WORKERS, resume=False,
+               checkpoint_file=CHECKPOINT_FILE,
+               watermark_file=WATERMARK_FILE, by_cursor=False,
+               compact=False):
+    file_names = {sink.file_name for sink in sinks}
+    params = compact_params(sinks) if compact else None
+    checkpoint = load_checkpoint(checkpoint_file) if resume else None
+    if checkpoint and (set(checkpoint.get("offsets", {})) != file_names
+                       or not all(map(os.path.exists, file_names))
+                       or ("cursor" in checkpoint) != by_cursor
+                       or checkpoint.get("params") != params):
+        logging.warning(f"Checkpoint does not match "
+                        f"{', '.join(sorted(file_names))}, "
+                        f"starting from page 0")
+        checkpoint = None
+    start_page = checkpoint["page"] + 1 if checkpoint else 0
+    cursor = checkpoint.get("cursor", "") if checkpoint else ""
+    if checkpoint:
+        logging.info(f"Resuming from page {start_page}")
+
+    try:
+        pages = iter_pages(workers, by_cursor, start_page, cursor, params)
+        watermark = stream_to_csv(pages, sinks, checkpoint_file, checkpoint,
+                                  by_cursor, params)
+    except requests.exceptions.RequestException:
+        logging.error("Fetch interrupted, re-run with --resume to "
+                      "continue from the last committed page")
+        return False
+    save_watermark(watermark, watermark_file)
+    return True
+
+
+# Fetch only items updated since the saved watermark
+def run_incremental(sinks, workers=PAGE_WORKERS,
+                    checkpoint_file=CHECKPOINT_FILE,
+                    watermark_file=WATERMARK_FILE, by_cursor=False,
+                    compact=False):
+    since = load_watermark(watermark_file)
+    if since is None:
+        logging.info("No watermark yet, running a full fetch")
+        return run_stream(sinks, workers, False, checkpoint_file,
+                          watermark_file, by_cursor, compact)
+
+    params = {"since": since}
+    if compact:
+        params.update(compact_params(sinks))
+    changed = []
+    try:
+        for _, items in iter_pages(workers, by_cursor, params=params):
+            changed.extend(items)
+    except requests.exceptions.RequestException:
+        logging.error("Incremental fetch failed, existing files untouched")
+        return False
+
+    logging.info(f"Fetched {len(changed)} items updated since {since}")
+    for sink in sinks:
+        merge_into_csv(sink, changed)
+    save_watermark(max_updated_date(changed, since), watermark_file)
+    return True
+
+
 # Main process
 if __name__ == "__main__":
-    data = fetch_wix_data()
+    # Configure logging
+    logging.basicConfig(
+        filename="fetch_wix_data.log",
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    parser = argparse.ArgumentParser(description="Fetch products from Wix")
+    parser.add_argument("--workers", type=int, default=PAGE_WORKERS,
+                        help="number of page requests kept in flight")
+    parser.add_argument("--stream", action="store_true",
+                        help="write each page to CSV as it arrives")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted --stream run from "
+                             "its checkpoint")
+    parser.add_argument("--with-urls", action="store_true",
+                        help="also write products_urls.csv from the same "
+                             "crawl (implies --stream)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="fetch only items updated since the last "
+                             "run and merge them into the existing CSV")
+    parser.add_argument("--cursor", action="store_true",
+                        help="page by keyset cursor instead of page number")
+    parser.add_argument("--compact", action="store_true",
+                        help="request only the fields the CSV uses (in "
+                             "pages of COMPACT_PAGE_LIMIT items when only "
+                             "products_urls.csv is written)")
+    parser.add_argument("--json-columns", action="store_true",
+                        help="write product options and media items as "
+                             "JSON instead of Python literals")
+    args = parser.parse_args()
+    workers = max(1, args.workers)
+    if args.json_columns:
+        NESTED_FORMAT = "json"
+
+    if args.incremental:
+        sinks = [PRODUCTS_SINK]
+        if args.with_urls:
+            sinks.append(URLS_SINK)
+        ok = run_incremental(sinks, workers, by_cursor=args.cursor,
+                             compact=args.compact)
+        exit(0 if ok else 1)
+
+    if args.stream or args.resume or args.with_urls:
+        sinks = [PRODUCTS_SINK]
+        if args.with_urls:
+            sinks.append(URLS_SINK)
+        ok = run_stream(sinks, workers, args.resume, by_cursor=args.cursor,
+                        compact=args.compact)
+        exit(0 if ok else 1)
+
+    params = compact_params([PRODUCTS_SINK]) if args.compact else None
+    data = fetch_wix_data(workers=workers, by_cursor=args.cursor,
+                          params=params)
 
     # ensure data is a list, extract it if nested
     if isinstance(data, dict) and 'items' in data:
@@ -1,8 +1,9 @@
-import requests
 import csv
-import os
 import logging
-from dotenv import load_dotenv
+import argparse
+from fetch_wix_data import (fetch_wix_data, run_stream, run_incremental,
+                            compact_params, url_row, URL_HEADERS, URLS_SINK,
+                            PAGE_WORKERS)
 
 # Configure logging
 logging.basicConfig(
@@ -11,45 +12,8 @@ logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
-load_dotenv()
-# Define the API endpoint and authorization token
-API_URL = os.getenv('API_URL')
-PAGE_LIMIT = 20
-
-
-# Fetch data from Wix
-def fetch_wix_data():
-    # headers = {"Authorization": f"Bearer {AUTH_TOKEN}"}
-    all_items = []
-    page = 0
-    while True:
-        try:
-            paginated_url = f"{API_URL}?page={page}&limit={PAGE_LIMIT}"
-            response = requests.get(paginated_url)
-            response.raise_for_status()
-
-            data = response.json()
-            if not data:
-                logging.warning('Api returned an empty response.')
-                break
-
-            if not isinstance(data, dict) or 'items' not in data:
-                logging.warning(f"Unexpected response format on"
-                                f"page {page}: {data}")
-                break
-
-            items = data.get("items", [])
-
-            all_items.extend(items)
-            logging.info(f"Fetched page {page}, items: {len(items)}")
-            if not data.get("hasNext", False):
-                break
-            page += 1
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Error fetching data: {e}")
-            break
-    logging.info(f"Fetched {len(all_items)} items")
-    return {"items": all_items}
+CHECKPOINT_FILE = "fetch_wix_product_url.checkpoint"
+WATERMARK_FILE = "fetch_wix_product_url.watermark"
 
 
 # Save data to CSV
@@ -59,23 +23,15 @@ def save_to_csv(data, file_name="products_urls.csv"):
         logging.error("No data to save.Exiting")
         return
 
-    # Define CSV column headers
-    headers = ["wix_product_url", "Name", 'created_date', 'slug']
-
     with open(file_name, mode="w", newline="", encoding="utf-8") as file:
-        writer = csv.DictWriter(file, fieldnames=headers)
+        writer = csv.DictWriter(file, fieldnames=URL_HEADERS)
         writer.writeheader()
 
         row_count = 0
         for item in data:
             # if number == 50:
             #    break
-            writer.writerow({
-                "wix_product_url": item["productPageUrl"],
-                "Name": item.get("name", ""),
-                "created_date": item.get("createdDate", ""),
-                "slug": item.get("slug", ""),
-            })
+            writer.writerow(url_row(item))
             row_count += 1
             if row_count % 100 == 0:
                 logging.info(f"Processed {row_count} rows...")
@@ -86,7 +42,39 @@ def save_to_csv(data, file_name="products_urls.csv"):
 
 # Main process
 if __name__ == "__main__":
-    data = fetch_wix_data()
+    parser = argparse.ArgumentParser(description="Fetch product URLs "
+                                                 "from Wix")
+    parser.add_argument("--workers", type=int, default=PAGE_WORKERS,
+                        help="number of page requests kept in flight")
+    parser.add_argument("--stream", action="store_true",
+                        help="write each page to CSV as it arrives")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted --stream run from "
+                             "its checkpoint")
+    parser.add_argument("--incremental", action="store_true",
+                        help="fetch only items updated since the last "
+                             "run and merge them into the existing CSV")
+    parser.add_argument("--cursor", action="store_true",
+                        help="page by keyset cursor instead of page number")
+    parser.add_argument("--compact", action="store_true",
+                        help="request only the fields the CSV uses, in "
+                             "pages of COMPACT_PAGE_LIMIT items")
+    args = parser.parse_args()
+    workers = max(1, args.workers)
+
+    if args.incremental:
+        ok = run_incremental([URLS_SINK], workers, CHECKPOINT_FILE,
+                             WATERMARK_FILE, args.cursor, args.compact)
+        exit(0 if ok else 1)
+
+    if args.stream or args.resume:
+        ok = run_stream([URLS_SINK], workers, args.resume, CHECKPOINT_FILE,
+                        WATERMARK_FILE, args.cursor, args.compact)
+        exit(0 if ok else 1)
+
+    params = compact_params([URLS_SINK]) if args.compact else None
+    data = fetch_wix_data(workers=workers, by_cursor=args.cursor,
+                          params=params)
 
     # ensure data is a list, extract it if nested
     if isinstance(data, dict) and 'items' in data:
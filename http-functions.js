@@ -4,10 +4,27 @@
 import { ok, badRequest, serverError } from "wix-http-functions";
 import wixData  from "wix-data";
 
+// Item fields that make up most of a product's size
+const HEAVY_FIELDS = ["description", "mediaItems", "productOptions"];
+
 export async function get_storeListing(request) {
     const queryParams = request.query;
     const page = parseInt(queryParams.page || "0");
     const limit = parseInt(queryParams.limit || "50");
+    // Only return items updated at or after this ISO date, if given
+    const since = queryParams.since ? new Date(queryParams.since) : null;
+    // Keyset paging: pass cursor= (empty) for the first page, then the
+    // nextCursor of the previous response. Page numbers are ignored.
+    const cursor = queryParams.cursor;
+    // Comma-separated item fields to return; all fields if omitted
+    const fields = queryParams.fields
+        ? queryParams.fields.split(",").map((field) => field.trim())
+        : null;
+    // Larger pages are only allowed when the projection leaves out the
+    // heavy fields; with any of them the items are as large as unprojected
+    const light = fields !== null
+        && !fields.some((field) => HEAVY_FIELDS.includes(field));
+    const maxLimit = light ? 1000 : 100;
 
     const options = {
         headers: {
@@ -15,23 +32,49 @@ export async function get_storeListing(request) {
         }
     };
 
-    if (limit > 100 || limit < 1) {
-        options.body = { error: "Limit must be between 1 and 100." };
+    if (limit > maxLimit || limit < 1) {
+        options.body = { error: `Limit must be between 1 and ${maxLimit}.` };
+        return badRequest(options);
+    }
+
+    if (since && isNaN(since.getTime())) {
+        options.body = { error: "since must be an ISO date." };
         return badRequest(options);
     }
 
     try {
-        const results = await wixData.query("Stores/Products")
-            .skip(page * limit)
+        let query = wixData.query("Stores/Products");
+        if (since) {
+            query = query.ge("_updatedDate", since);
+        }
+        if (cursor !== undefined) {
+            query = query.ascending("_id");
+            if (cursor) {
+                query = query.gt("_id", cursor);
+            }
+        } else {
+            query = query.skip(page * limit);
+        }
+        const results = await query
             .limit(limit)
             .find();
 
+        const hasNext = results.hasNext();
+        const lastItem = results.items[results.items.length - 1];
+        const items = fields
+            ? results.items.map((item) => Object.fromEntries(
+                fields.filter((field) => field in item)
+                    .map((field) => [field, item[field]])))
+            : results.items;
 
         options.body = {
-            items: results.items,
-            hasNext: results.hasNext(),
+            items: items,
+            hasNext: hasNext,
             currentPage: page
         };
+        if (cursor !== undefined) {
+            options.body.nextCursor = hasNext && lastItem ? lastItem._id : null;
+        }
 
         return ok(options);
     } catch (error) {
@@ -2,8 +2,8 @@ import csv
 import os
 import logging
 import re
-import xmlrpc.client
 from dotenv import load_dotenv
+from odoo_rpc import server_proxies
 
 
 load_dotenv()
@@ -19,9 +19,8 @@ logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(message)s",
     datefmt="%Y-%m-%d %H:%M:%S"
 )
-common = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/common")
+common, models = server_proxies(ODOO_URL)
 uid = common.authenticate(DB_NAME, USERNAME, PASSWORD, {})
-models = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/object")
 
 
 def import_contacts(csv_file):
@@ -1,8 +1,8 @@
 import csv
-import xmlrpc.client
 import os
 import logging
 from dotenv import load_dotenv
+from odoo_rpc import server_proxies
 
 load_dotenv()
 ODOO_URL = os.getenv('ODOO_URL')
@@ -19,15 +19,13 @@ logging.basicConfig(
 )
 
 # Connect to Odoo
-common = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/common")
+common, models = server_proxies(ODOO_URL)
 uid = common.authenticate(DB_NAME, USERNAME, PASSWORD, {})
 
 if not uid:
     logging.error("Failed to authenticate with Odoo.")
     exit()
 
-models = xmlrpc.client.ServerProxy(f"{ODOO_URL}/xmlrpc/2/object")
-
 BATCH_SIZE = 100
 
 
@@ -0,0 +1,14 @@
+import ast
+import json
+
+
+# Parse a nested CSV column
+def parse_nested(text):
+    """
+    Columns are written as JSON by `fetch_wix_data.py --json-columns`
+    and as Python literals otherwise; try the fast JSON parser first.
+    """
+    try:
+        return json.loads(text)
+    except ValueError:
+        return ast.literal_eval(text)
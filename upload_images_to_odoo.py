@@ -1,9 +1,15 @@
 import csv
-import xmlrpc.client
 import base64
 import os
+import time
 import logging
+import argparse
+import threading
+from queue import Queue
+from collections import Counter
+from functools import lru_cache
 from dotenv import load_dotenv
+from odoo_rpc import server_proxies
 
 load_dotenv()
 ODOO_URL = os.getenv('ODOO_URL')
@@ -18,26 +24,268 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S"
 )
 
+# Encoded images kept in memory; download_images.py stores each distinct
+# image once, so rows sharing an image read and encode it once
+IMAGE_CACHE_SIZE = 128
+# External IDs resolved per ir.model.data search_read
+EXTERNAL_ID_CHUNK = 1000
+# Base64 image data sent in one multi-record product.image create
+EXTRA_IMAGE_BATCH_BYTES = int(os.getenv('EXTRA_IMAGE_BATCH_BYTES',
+                                        8 * 1024 * 1024))
+# Products uploaded at once, each worker on its own Odoo connection
+UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', 1))
+# Login attempts per upload worker, and seconds before the first retry
+LOGIN_ATTEMPTS = 3
+LOGIN_RETRY_DELAY = 5
+# Products whose Size attribute lines are checked and written together
+SIZE_LINE_BATCH = 200
+
+
+# Read an image file as base64 text
+@lru_cache(maxsize=IMAGE_CACHE_SIZE)
+def read_image_base64(image_path):
+    with open(image_path, "rb") as img_file:
+        return base64.b64encode(img_file.read()).decode("utf-8")
+
+
+def resolve_external_ids(models, db_name, uid, password, external_ids,
+                         chunk_size=EXTERNAL_ID_CHUNK):
+    """
+    Map imported product External IDs to product.template ids with one
+    search_read per `chunk_size` IDs. IDs that don't exist are left out.
+    """
+    external_ids = list(dict.fromkeys(external_ids))
+    product_ids = {}
+    for start in range(0, len(external_ids), chunk_size):
+        chunk = external_ids[start:start + chunk_size]
+        records = models.execute_kw(
+            db_name, uid, password, "ir.model.data", "search_read",
+            [[["module", "=", "__import__"],
+              ["model", "=", "product.template"],
+              ["name", "in", chunk]]],
+            {"fields": ["name", "res_id"]}
+        )
+        for record in records:
+            product_ids[record["name"]] = record["res_id"]
+    logging.info(f"Resolved {len(product_ids)} of {len(external_ids)} "
+                 f"External IDs")
+    return product_ids
+
+
+class ProductImageBatch:
+    """
+    Collects product.image records and creates them with one multi-record
+    `create` per `max_bytes` of image data. If a batch is refused, its
+    records are created one by one so a single bad image only fails
+    itself. `uploaded` maps each file name to the first product.image
+    made from it, so later uses can be copied on the server. Records are
+    named for the gallery, not after the hashed file they were read from.
+    """
+
+    def __init__(self, models, db_name, uid, password,
+                 max_bytes=EXTRA_IMAGE_BATCH_BYTES, uploaded=None):
+        self.models = models
+        self.db_name = db_name
+        self.uid = uid
+        self.password = password
+        self.max_bytes = max_bytes
+        self.pending = []
+        self.pending_bytes = 0
+        # May be shared by the batches of several upload workers
+        self.uploaded = {} if uploaded is None else uploaded
+        self.created = 0
+        self.calls = 0
+
+    def add(self, product_id, image_name, image_data, record_name):
+        if (self.pending
+                and self.pending_bytes + len(image_data) > self.max_bytes):
+            self.flush()
+        self.pending.append((image_name, {
+            "product_tmpl_id": product_id,
+            "image_1920": image_data,
+            "name": record_name
+        }))
+        self.pending_bytes += len(image_data)
+
+    def is_pending(self, image_name):
+        return any(name == image_name for name, _ in self.pending)
+
+    def flush(self):
+        batch, self.pending, self.pending_bytes = self.pending, [], 0
+        if not batch:
+            return
+        if len(batch) > 1:
+            try:
+                self.calls += 1
+                ids = self.models.execute_kw(
+                    self.db_name, self.uid, self.password, "product.image",
+                    "create", [[values for _, values in batch]]
+                )
+                self.done(batch, ids)
+                return
+            except Exception as e:
+                logging.warning(f"Creating {len(batch)} extra images at "
+                                f"once failed, creating them one by one: "
+                                f"{e}")
+        for image_name, values in batch:
+            try:
+                self.calls += 1
+                image_id = self.models.execute_kw(
+                    self.db_name, self.uid, self.password, "product.image",
+                    "create", [values]
+                )
+                self.done([(image_name, values)], [image_id])
+            except Exception as e:
+                logging.error(f"Error uploading extra image "
+                              f"{image_name}: {e}")
+
+    def done(self, batch, ids):
+        for (image_name, _), image_id in zip(batch, ids):
+            self.uploaded.setdefault(image_name, image_id)
+        self.created += len(batch)
+        logging.info(f"Uploaded extra image progress: {self.created} "
+                     f"images uploaded in {self.calls} calls")
+
+
+# Log in to Odoo
+def connect(odoo_url, db_name, username, password):
+    """Returns (uid, models proxy); uid is False if the login failed."""
+    common, models = server_proxies(odoo_url)
+    uid = common.authenticate(db_name, username, password, {})
+    return uid, models
+
+
+# Log an upload worker in, retrying transient failures
+def connect_worker(odoo_url, db_name, username, password,
+                   attempts=LOGIN_ATTEMPTS):
+    """Returns (uid, models proxy), or (False, None) after `attempts`."""
+    for attempt in range(1, attempts + 1):
+        try:
+            uid, models = connect(odoo_url, db_name, username, password)
+            if uid:
+                return uid, models
+            error = "authentication failed"
+        except Exception as e:
+            error = e
+        logging.warning(f"Upload worker login attempt {attempt} of "
+                        f"{attempts} failed: {error}")
+        if attempt < attempts:
+            time.sleep(LOGIN_RETRY_DELAY * attempt)
+    return False, None
+
+
+# Upload the main image, extra images and sizes of one product
+def upload_product(models, db_name, uid, password, row, product_id,
+                   image_path, image_folder, extra_batch, size_lines):
+    # Read image and encode in base64
+    image_data = read_image_base64(image_path)
+
+    # Update product with image
+    models.execute_kw(
+        db_name, uid, password, "product.template", "write",
+        [[product_id], {"image_1920": image_data}]
+    )
+    if "extra_images" in row:
+        extra_images = row["extra_images"]
+        upload_extra_images(models, db_name, uid, password,
+                            product_id, extra_images, image_folder,
+                            extra_batch, row.get("Name"))
+    if "Size" in row and row['Size'].strip():
+        size_values = [size.strip() for size in row["Size"].split(',')
+                       if size.strip()]
+        update_product_sizes(models, db_name, uid, password,
+                             product_id, size_values, size_lines)
+    else:
+        logging.info(f"Skipping size update for product {product_id} "
+                     f"'Size' column is missing or empty.")
+
 
 def upload_images_to_odoo(odoo_url, db_name, username, password,
-                          csv_file, image_folder):
-    """Uploads product images to Odoo from a CSV file."""
+                          csv_file, image_folder, workers=UPLOAD_WORKERS):
+    """
+    Uploads product images to Odoo from a CSV file. `workers` threads,
+    each logged in with its own connection, take products from a short
+    queue, so at most a few products' images are held in memory at once.
+    Workers that can't log in are not started and the others take their
+    share; the upload is abandoned only if none can.
+    """
 
     # Connect to Odoo
-    common = xmlrpc.client.ServerProxy(f"{odoo_url}/xmlrpc/2/common")
-    uid = common.authenticate(db_name, username, password, {})
+    uid, models = connect(odoo_url, db_name, username, password)
 
     if not uid:
         logging.error("Failed to authenticate with Odoo. Check credentials.")
         return
 
-    models = xmlrpc.client.ServerProxy(f"{odoo_url}/xmlrpc/2/object")
-    counter = 0
     # Read CSV file
     with open(csv_file, mode="r", encoding="utf-8") as file:
-        reader = csv.DictReader(file)
-
-        for row in reader:
+        rows = list(csv.DictReader(file))
+
+    # Find every product by External ID up front
+    product_ids = resolve_external_ids(
+        models, db_name, uid, password,
+        [row["External ID"] for row in rows if row.get("External ID")])
+
+    sessions = [connect_worker(odoo_url, db_name, username, password)
+                for _ in range(workers)]
+    sessions = [session for session in sessions if session[0]]
+    if not sessions:
+        logging.error("No upload worker could log in to Odoo; nothing "
+                      "was uploaded")
+        return
+    if len(sessions) < workers:
+        logging.warning(f"Only {len(sessions)} of {workers} upload workers "
+                        f"logged in; uploading with those")
+
+    products = Queue(maxsize=len(sessions) * 2)
+    progress = Counter()
+    progress_lock = threading.Lock()
+    # Extra image file -> product.image id, shared by every worker
+    uploaded_images = {}
+    size_attribute = SizeAttribute()
+
+    def worker(worker_uid, worker_models):
+        extra_batch = ProductImageBatch(worker_models, db_name, worker_uid,
+                                        password, uploaded=uploaded_images)
+        size_lines = SizeLineBatch(worker_models, db_name, worker_uid,
+                                   password, size_attribute)
+        while True:
+            job = products.get()
+            if job is None:
+                break
+            row, product_id, image_path = job
+            try:
+                upload_product(worker_models, db_name, worker_uid, password,
+                               row, product_id, image_path, image_folder,
+                               extra_batch, size_lines)
+                outcome = "uploaded"
+            except Exception as e:
+                logging.error(f"Error uploading product {product_id} "
+                              f"({row.get('External ID')}): {e}")
+                outcome = "errors"
+            with progress_lock:
+                progress[outcome] += 1
+                if progress[outcome] % 100 == 0:
+                    logging.info(f"Uploaded images {progress['uploaded']}, "
+                                 f"{progress['errors']} errors")
+        try:
+            extra_batch.flush()
+        except Exception as e:
+            logging.error(f"Error uploading extra images: {e}")
+        try:
+            size_lines.flush()
+        except Exception as e:
+            logging.error(f"Error updating sizes: {e}")
+        with progress_lock:
+            progress["size_errors"] += size_lines.stats["failed"]
+
+    threads = [threading.Thread(target=worker, args=session)
+               for session in sessions]
+    for thread in threads:
+        thread.start()
+
+    try:
+        for row in rows:
             external_id = row.get("External ID")
             image_name = row.get("Image")
 
@@ -50,157 +298,279 @@ def upload_images_to_odoo(odoo_url, db_name, username, password,
             if not os.path.exists(image_path):
                 logging.warning(f"Image not found: {image_path}")
                 continue
-            try:
-                # Read image and encode in base64
-                with open(image_path, "rb") as img_file:
-                    image_data = base64.b64encode(img_file.read()
-                                                  ).decode("utf-8")
-
-                # Find product by External ID
-                product_ids = models.execute_kw(
-                    db_name, uid, password, "ir.model.data", "search_read",
-                    [[["model", "=", "product.template"],
-                      ["name", "=", external_id]]],
-                    {"fields": ["res_id"]}
-                )
-            except Exception as e:
-                logging.error(f'Error {e}: while reading {image_path}')
-                continue
 
-            if not product_ids:
+            product_id = product_ids.get(external_id)
+            if not product_id:
                 logging.warning(f"Product not found for External"
                                 f"ID: {external_id}")
                 continue
 
-            product_id = product_ids[0]['res_id']
+            products.put((row, product_id, image_path))
+    finally:
+        for _ in threads:
+            products.put(None)
+        for thread in threads:
+            thread.join()
 
-            # Update product with image
-            models.execute_kw(
-                db_name, uid, password, "product.template", "write",
-                [[product_id], {"image_1920": image_data}]
-            )
-            counter += 1
-            if counter % 100 == 0:
-                logging.info(f"Uploaded images {counter}")
-            if "extra_images" in row:
-                extra_images = row["extra_images"]
-                upload_extra_images(models, db_name, uid, password,
-                                    product_id, extra_images, image_folder)
-            if "Size" in row and row['Size'].strip():
-                size_values = [size.strip() for size in row["Size"].split(',')
-                               if size.strip()]
-                update_product_sizes(models, db_name, uid, password,
-                                     product_id, size_values)
-            else:
-                logging.info(f"Skipping size update for product {product_id} "
-                             f"'Size' column is missing or empty.")
-
-    logging.info(f"Main Image upload complete! {counter} images uploaded")
+    logging.info(f"Main Image upload complete! {progress['uploaded']} "
+                 f"images uploaded, {progress['errors']} products failed, "
+                 f"{progress['size_errors']} size updates failed")
 
 
 def upload_extra_images(models, db_name, uid, password, product_id,
-                        extra_images, image_folder):
-    """Uploads extra images to Odoo for a product."""
+                        extra_images, image_folder, batch=None,
+                        product_name=None):
+    """
+    Uploads extra images to Odoo for a product. New images are added to
+    `batch` (a ProductImageBatch, flushed here if none is given); images
+    it has already uploaded are copied on the server instead of being
+    sent again. Each image is named after the product and its place in
+    the gallery, e.g. "Shirt 2"; the file names are content hashes.
+    """
     counter = 0
+    own_batch = batch is None
+    if own_batch:
+        batch = ProductImageBatch(models, db_name, uid, password)
     if extra_images:
-        for image_name in extra_images.split(";"):
-            image_path = os.path.join(image_folder, image_name.strip())
+        for position, image_name in enumerate(extra_images.split(";"), 2):
+            image_name = image_name.strip()
+            record_name = (f"{product_name} {position}" if product_name
+                           else image_name)
+            image_path = os.path.join(image_folder, image_name)
 
             if not os.path.exists(image_path):
                 logging.warning(f"Extra image not found: {image_path}")
                 continue
 
             try:
-                with open(image_path, "rb") as img_file:
-                    image_data = base64.b64encode(img_file.read()
-                                                  ).decode("utf-8")
-
-                models.execute_kw(
-                    db_name, uid, password, "product.image", "create",
-                    [{
-                        "product_tmpl_id": product_id,
-                        "image_1920": image_data,
-                        "name": image_name
-                    }]
-                )
+                if batch.is_pending(image_name):
+                    batch.flush()
+                if image_name in batch.uploaded:
+                    try:
+                        models.execute_kw(
+                            db_name, uid, password, "product.image", "copy",
+                            [[batch.uploaded[image_name]]],
+                            {"default": {"product_tmpl_id": product_id,
+                                         "name": record_name}}
+                        )
+                        counter += 1
+                        continue
+                    except Exception as e:
+                        logging.warning(f"Copying extra image {image_name} "
+                                        f"failed, uploading it: {e}")
+
+                batch.add(product_id, image_name,
+                          read_image_base64(image_path), record_name)
                 counter += 1
-                if counter % 100 == 0:
-                    logging.info(f"Uploaded extra image progress:"
-                                 f"{counter} images uploaded")
 
             except Exception as e:
                 logging.error(f"Error uploading extra image {image_name}: {e}")
-    logging.info(f"Extra Images upload complete! {counter} images uploaded")
+    if own_batch:
+        batch.flush()
+    logging.info(f"Extra Images for product {product_id}: {counter} "
+                 f"images copied or queued")
+
+
+class SizeAttribute:
+    """
+    The "Size" product.attribute and its values, read from Odoo once per
+    run and shared by every upload worker. Values missing from Odoo are
+    created together and added to the cache.
+    """
+
+    def __init__(self):
+        self.attribute_id = None
+        self.value_ids = {}
+        self.lock = threading.Lock()
+
+    def load(self, models, db_name, uid, password):
+        # Ensure the attribute "Size" exists in Odoo
+        attribute_ids = models.execute_kw(
+            db_name, uid, password, "product.attribute", "search",
+            [[["name", "=", "Size"]]]
+        )
+        if attribute_ids:
+            attribute_id = attribute_ids[0]
+        else:
+            attribute_id = models.execute_kw(
+                db_name, uid, password, "product.attribute", "create",
+                [{"name": "Size"}]
+            )
 
+        # Get existing size values in Odoo
+        existing_size_values = models.execute_kw(
+            db_name, uid, password, "product.attribute.value", "search_read",
+            [[["attribute_id", "=", attribute_id]]],
+            {"fields": ["id", "name"]}
+        )
+        # Only cached once both reads succeeded, so a failed load is retried
+        self.value_ids = {val["name"]: val["id"] for val in
+                          existing_size_values}
+        self.attribute_id = attribute_id
+
+    def resolve(self, models, db_name, uid, password, sizes):
+        """Return the value ids of `sizes`, creating any that are new."""
+        with self.lock:
+            if self.attribute_id is None:
+                self.load(models, db_name, uid, password)
+            missing = list(dict.fromkeys(
+                size for size in sizes if size not in self.value_ids))
+            if missing:
+                # Create new size values
+                new_ids = models.execute_kw(
+                    db_name, uid, password, "product.attribute.value",
+                    "create",
+                    [[{"name": size, "attribute_id": self.attribute_id}
+                      for size in missing]]
+                )
+                self.value_ids.update(zip(missing, new_ids))
+                logging.info(f"Created size values: {missing}")
+            return [self.value_ids[size] for size in sizes]
+
+
+class SizeLineBatch:
+    """
+    Collects the sizes of up to `batch_size` products, then reads their
+    existing Size lines in one call. Products without a line get one in
+    a single multi-record create, lines with other values are rewritten,
+    and identical lines are left alone, so re-runs change nothing. If a
+    batch fails, its products are written one by one so a bad product
+    only fails itself.
+    """
+
+    def __init__(self, models, db_name, uid, password, attribute,
+                 batch_size=SIZE_LINE_BATCH):
+        self.models = models
+        self.db_name = db_name
+        self.uid = uid
+        self.password = password
+        self.attribute = attribute
+        self.batch_size = batch_size
+        self.pending = {}
+        self.stats = Counter()
+
+    def add(self, product_id, size_values):
+        self.pending[product_id] = size_values
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        if len(pending) > 1:
+            try:
+                self.write(pending)
+                return
+            except Exception as e:
+                logging.warning(f"Updating sizes for {len(pending)} "
+                                f"products at once failed, updating them "
+                                f"one by one: {e}")
+        for product_id, sizes in pending.items():
+            try:
+                self.write({product_id: sizes})
+            except Exception as e:
+                self.stats["failed"] += 1
+                logging.error(f"Error updating sizes for product "
+                              f"{product_id}: {e}")
+
+    def write(self, pending):
+        """Write the Size lines of {product_id: [size, ...]}."""
+        models, db_name = self.models, self.db_name
+        uid, password = self.uid, self.password
+
+        value_ids = {}
+        all_ids = self.attribute.resolve(
+            models, db_name, uid, password,
+            [size for sizes in pending.values() for size in sizes])
+        position = 0
+        for product_id, sizes in pending.items():
+            ids = all_ids[position:position + len(sizes)]
+            value_ids[product_id] = list(dict.fromkeys(ids))
+            position += len(sizes)
+
+        existing_lines = models.execute_kw(
+            db_name, uid, password, "product.template.attribute.line",
+            "search_read",
+            [[["attribute_id", "=", self.attribute.attribute_id],
+              ["product_tmpl_id", "in", list(pending)]]],
+            {"fields": ["product_tmpl_id", "value_ids"]}
+        )
+        lines = {line["product_tmpl_id"][0]: line for line in existing_lines}
+
+        to_create = []
+        # Lines to rewrite, grouped by their new values
+        to_write = {}
+        for product_id, ids in value_ids.items():
+            line = lines.get(product_id)
+            if line is None:
+                to_create.append({
+                    "product_tmpl_id": product_id,
+                    "attribute_id": self.attribute.attribute_id,
+                    "value_ids": [(6, 0, ids)]
+                })
+            elif set(line["value_ids"]) != set(ids):
+                to_write.setdefault(tuple(ids), []).append(line["id"])
+            else:
+                self.stats["unchanged"] += 1
 
-def update_product_sizes(models, db_name, uid, password, product_id,
-                         size_values):
-    """Updates product attributes in Odoo based on the sizes provided."""
+        # Link the sizes to the products
+        if to_create:
+            models.execute_kw(
+                db_name, uid, password, "product.template.attribute.line",
+                "create", [to_create]
+            )
+            self.stats["created"] += len(to_create)
+        for ids, line_ids in to_write.items():
+            models.execute_kw(
+                db_name, uid, password, "product.template.attribute.line",
+                "write", [line_ids, {"value_ids": [(6, 0, list(ids))]}]
+            )
+            self.stats["updated"] += len(line_ids)
+
+        logging.info(f"Updated sizes for {len(pending)} products: "
+                     f"{self.stats['created']} lines created, "
+                     f"{self.stats['updated']} updated, "
+                     f"{self.stats['unchanged']} unchanged, "
+                     f"{self.stats['failed']} failed so far")
 
+
+def update_product_sizes(models, db_name, uid, password, product_id,
+                         size_values, size_lines=None):
+    """
+    Updates product attributes in Odoo based on the sizes provided. With
+    a SizeLineBatch the update is queued in it; otherwise it is written
+    right away.
+    """
+
+    size_values = [size.strip() for size in size_values if size.strip()]
     if not size_values:
         logging.info(f"No sizes to update for product {product_id}")
         return
 
-    # Ensure the attribute "Size" exists in Odoo
-    size_attribute_id = models.execute_kw(
-        db_name, uid, password, "product.attribute", "search",
-        [[["name", "=", "Size"]]]
-    )
-
-    if not size_attribute_id:
-        size_attribute_id = models.execute_kw(
-            db_name, uid, password, "product.attribute", "create",
-            [{"name": "Size"}]
-        )
+    if size_lines is None:
+        batch = SizeLineBatch(models, db_name, uid, password,
+                              SizeAttribute())
+        batch.add(product_id, size_values)
+        batch.flush()
     else:
-        size_attribute_id = size_attribute_id[0]  # Extract the ID
-
-    # Get existing size values in Odoo
-    existing_size_values = models.execute_kw(
-        db_name, uid, password, "product.attribute.value", "search_read",
-        [[["attribute_id", "=", size_attribute_id]]],
-        {"fields": ["id", "name"]}
-    )
-
-    existing_size_dict = {val["name"]: val["id"] for val in
-                          existing_size_values}
-
-    size_value_ids = []
-    for size in size_values:
-        size = size.strip()
-        if not size:
-            continue
-
-        if size in existing_size_dict:
-            size_value_ids.append(existing_size_dict[size])
-        else:
-            # Create new size value
-            new_size_id = models.execute_kw(
-                db_name, uid, password, "product.attribute.value", "create",
-                [{"name": size, "attribute_id": size_attribute_id}]
-            )
-            size_value_ids.append(new_size_id)
-            existing_size_dict[size] = new_size_id  # Update cache
-
-    # Link the sizes to the product
-    models.execute_kw(
-        db_name, uid, password, "product.template.attribute.line", "create",
-        [{
-            "product_tmpl_id": product_id,
-            "attribute_id": size_attribute_id,
-            "value_ids": [(6, 0, size_value_ids)]
-        }]
-    )
-
-    logging.info(f"Updated sizes for product {product_id}: {size_values}")
+        size_lines.add(product_id, size_values)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upload product images "
+                                                 "and sizes to Odoo")
+    parser.add_argument("--workers", type=int, default=UPLOAD_WORKERS,
+                        help="products uploaded at once, each on its own "
+                             "Odoo connection")
+    args = parser.parse_args()
+
     upload_images_to_odoo(
         odoo_url=ODOO_URL,
         db_name=DB_NAME,
         username=USERNAME,
         password=PASSWORD,
         csv_file="products_with_absolute_urls.csv",
-        image_folder="compressed_images"
+        image_folder="compressed_images",
+        workers=max(1, args.workers)
     )
@@ -0,0 +1,205 @@
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# Item fields that keep a projected item as large as a full one; pages
+# over 100 items are refused when any of them is requested, as in
+# http-functions.js
+HEAVY_FIELDS = {"description", "mediaItems", "productOptions"}
+
+
+# Build a synthetic Stores/Products catalog
+def make_catalog(size, seed=0):
+    """
+    Return `size` items shaped like Wix Stores/Products rows, sorted by
+    `_id` so keyset paging works like the real collection.
+    """
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    catalog = []
+    for i in range(size):
+        created = start + timedelta(minutes=i)
+        updated = created + timedelta(days=rng.randint(0, 300))
+        media_count = rng.randint(1, 8)
+        catalog.append({
+            "_id": f"{i:08d}-0000-4000-8000-{rng.getrandbits(48):012x}",
+            "_updatedDate": updated.isoformat().replace("+00:00", "Z"),
+            "name": f"Product {i}",
+            "slug": f"product-{i}",
+            "productPageUrl": f"/product-page/product-{i}",
+            "createdDate": created.isoformat().replace("+00:00", "Z"),
+            "inStock": rng.random() > 0.1,
+            "discountedPrice": round(rng.uniform(1, 500), 2),
+            "brand": rng.choice(["", "Acme", "Globex", "Initech"]),
+            # Variants share descriptions, as they do in real stores
+            "description": (f"<p>Description <b>{i % 500}</b> &amp; "
+                            f"details</p><ul><li>Feature</li></ul>"),
+            "mediaItems": [{
+                "type": "Image",
+                "title": "",
+                "src": (f"wix:image://v1/{i % 2000:06x}_{m}~mv2.jpg/"
+                        f"image.jpg#originWidth=3000&originHeight=2000"),
+            } for m in range(media_count)],
+            "productOptions": {
+                "Size": {"optionType": "drop_down", "name": "Size",
+                         "choices": [{"value": size_name,
+                                      "description": size_name}
+                                     for size_name in ("S", "M", "L")]},
+            } if rng.random() > 0.5 else {},
+        })
+    return catalog
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers like get_storeListing in http-functions.js."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query,
+                                              keep_blank_values=True).items()}
+
+        if url.path == "/_stats":
+            with server.lock:
+                self.send_json(200, dict(server.stats))
+            return
+        if url.path == "/_reset":
+            with server.lock:
+                server.stats.update(requests=0, errors=0, served=0,
+                                    retries=0)
+                server.seen.clear()
+            self.send_json(200, {})
+            return
+
+        with server.lock:
+            server.stats["requests"] += 1
+            # A repeated query is a client retrying an earlier request
+            if url.query in server.seen:
+                server.stats["retries"] += 1
+            server.seen.add(url.query)
+            inject_error = server.rng.random() < server.error_rate
+            if inject_error:
+                server.stats["errors"] += 1
+        if server.latency:
+            time.sleep(server.latency)
+        if inject_error:
+            headers = {}
+            if server.retry_after is not None:
+                headers["Retry-After"] = str(server.retry_after)
+            self.send_json(server.error_status, {"error": "injected"},
+                           headers)
+            return
+
+        self.send_json(*self.store_listing(query))
+
+    def store_listing(self, query):
+        page = int(query.get("page") or 0)
+        limit = int(query.get("limit") or 50)
+        since = query.get("since")
+        cursor = query.get("cursor")
+        fields = ([field.strip() for field in query["fields"].split(",")]
+                  if query.get("fields") else None)
+        light = fields is not None and not set(fields) & HEAVY_FIELDS
+        max_limit = 1000 if light else 100
+        if limit > max_limit or limit < 1:
+            return 400, {"error": f"Limit must be between 1 and "
+                                  f"{max_limit}."}
+
+        items = self.server.catalog
+        if since:
+            items = [item for item in items if item["_updatedDate"] >= since]
+        if cursor is not None:
+            if cursor:
+                items = [item for item in items if item["_id"] > cursor]
+            chunk = items[:limit]
+            has_next = len(items) > limit
+        else:
+            chunk = items[page * limit:(page + 1) * limit]
+            has_next = (page + 1) * limit < len(items)
+        if fields:
+            chunk = [{field: item[field] for field in fields if field in item}
+                     for item in chunk]
+
+        body = {"items": chunk, "hasNext": has_next, "currentPage": page}
+        if cursor is not None:
+            body["nextCursor"] = chunk[-1]["_id"] if has_next else None
+        with self.server.lock:
+            self.server.stats["served"] += 1
+        return 200, body
+
+
+# Start the stub in a background thread
+def start_server(catalog_size=1000, latency=0.0, error_rate=0.0,
+                 error_status=503, retry_after=None, port=0, seed=0):
+    """
+    Serve a synthetic catalog on 127.0.0.1:`port` (0 picks a free port).
+    `latency` seconds are added to every request and `error_rate` of
+    requests fail with `error_status`. Returns the running server; its
+    URL is http://127.0.0.1:{server.server_address[1]}/.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    server.catalog = make_catalog(catalog_size, seed)
+    server.latency = latency
+    server.error_rate = error_rate
+    server.error_status = error_status
+    server.retry_after = retry_after
+    server.rng = random.Random(seed)
+    server.lock = threading.Lock()
+    server.stats = {"requests": 0, "errors": 0, "served": 0, "retries": 0}
+    server.seen = set()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info(f"Serving {catalog_size} items on port "
+                 f"{server.server_address[1]}")
+    return server
+
+
+if __name__ == "__main__":
+    # Configure logging
+    logging.basicConfig(
+        filename="wix_stub_server.log",
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    parser = argparse.ArgumentParser(description="Local stand-in for the "
+                                                 "storeListing endpoint")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--items", type=int, default=1000,
+                        help="size of the synthetic catalog")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds added to every request")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--retry-after", type=int, default=None,
+                        help="Retry-After seconds sent with failures")
+    args = parser.parse_args()
+
+    server = start_server(args.items, args.latency, args.error_rate,
+                          args.error_status, args.retry_after, args.port)
+    print(f"Set API_URL=http://127.0.0.1:{server.server_address[1]}/")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()